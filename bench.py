@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import glob
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+import utils
+
+
+basedir = os.path.dirname(os.path.abspath(__file__))
+
+startup_commands = {
+  "import utils": [sys.executable, "-c", "import utils"],
+  "import kalpi": [sys.executable, "-c", "import kalpi"],
+  "kalpi.py --help": [sys.executable, "kalpi.py", "--help"],
+  "kalpi.py --publish": [sys.executable, "kalpi.py", "--publish", "bench-missing-draft.md"],
+}
+
+
+def run_timed(cmd, runs):
+  timings = []
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=basedir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    timings.append((time.perf_counter() - start) * 1000)
+  return timings
+
+
+def import_costs(module, count=10):
+  # top level imports of module by cumulative -X importtime cost, in ms
+  proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import %s" % (module)], cwd=basedir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+  costs = {}
+  for line in proc.stderr.split("\n"):
+    match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)", line)
+    if match and len(match.group(2)) <= 2:
+      costs[match.group(3)] = int(match.group(1)) / 1000
+  return dict(sorted(costs.items(), key=lambda x: x[1], reverse=True)[:count])
+
+
+def bench_startup(runs=10):
+  results = {"startup": {}, "imports": {}}
+  rows = []
+  for name in startup_commands:
+    timings = run_timed(startup_commands[name], runs)
+    results["startup"][name] = {"min": min(timings), "median": statistics.median(timings)}
+    rows.append("%s___%.1f___%.1f" % (name, min(timings), statistics.median(timings)))
+  utils.to_table(["Command", "Min (ms)", "Median (ms)"], rows, aligndict={"Command": "l", "Min (ms)": "r", "Median (ms)": "r"})
+
+  for module in ["utils", "kalpi"]:
+    results["imports"][module] = import_costs(module)
+    rows = ["%s___%.1f" % (name, cost) for name, cost in results["imports"][module].items()]
+    utils.to_table(["Import (%s)" % (module), "Cumulative (ms)"], rows, aligndict={"Import (%s)" % (module): "l", "Cumulative (ms)": "r"})
+  return results
+
+
+corpus_tags = ["python", "c", "linux", "windows", "exploit", "reversing", "ctf", "htb", "vulnhub", "oscp", "web", "crypto", "forensics", "malware", "networking", "notes", "tools", "fuzzing", "kernel", "privesc", "osint", "astro", "fitness", "books", "life", "research", "bitcoin", "golang", "rust", "javascript"]
+corpus_words = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo consequat".split()
+
+
+def corpus_post(rng, idx):
+  date = time.localtime(rng.randint(1104537600, 1735603200))
+  lines = [
+    "Synthetic post %d %s" % (idx, " ".join(rng.sample(corpus_words, 3))),
+    "date: %s" % (time.strftime("%d/%b/%Y", date)),
+    "summary: %s" % (" ".join(rng.sample(corpus_words, 8))),
+    "tags: %s" % (", ".join(rng.sample(corpus_tags, rng.randint(1, 4)))),
+    "status: %s" % ("draft" if rng.random() < 0.05 else "public"),
+    "",
+  ]
+  for section in range(rng.randint(2, 6)):
+    lines += ["## Section %d" % (section+1), ""]
+    for _ in range(rng.randint(1, 4)):
+      lines += [" ".join(rng.choice(corpus_words) for _ in range(rng.randint(30, 120))), ""]
+    if rng.random() < 0.6:
+      lines += ["```python"] + ["value_%d = %d  # %s" % (x, rng.randint(0, 1000), rng.choice(corpus_words)) for x in range(rng.randint(3, 25))] + ["```", ""]
+    if rng.random() < 0.3:
+      lines += ["| name | value |", "|---|---|"] + ["| %s | %d |" % (rng.choice(corpus_words), rng.randint(0, 100)) for _ in range(rng.randint(2, 8))] + [""]
+    if rng.random() < 0.3:
+      lines += ["- %s" % (" ".join(rng.sample(corpus_words, 5))) for _ in range(rng.randint(2, 6))] + [""]
+  return "\n".join(lines)
+
+
+def make_corpus(workdir, count, seed=1):
+  # mirrors the $HOME/$PROJECTSDIR layout kalpi reads, templates and data files come from the real site
+  home, projects = os.path.join(workdir, "home"), os.path.join(workdir, "projects")
+  realhome, realprojects = utils.expand_env(var="$HOME"), utils.expand_env(var="$PROJECTSDIR")
+  shutil.copytree(os.path.join(realprojects, "7h3rAm.github.io", "_templates"), os.path.join(projects, "7h3rAm.github.io", "_templates"))
+  shutil.copytree(os.path.join(realprojects, "cv"), os.path.join(projects, "cv"))
+  utils.mkdirp(os.path.join(home, "bootstrap"))
+  shutil.copy2(os.path.join(realhome, "bootstrap", "self.yml"), os.path.join(home, "bootstrap", "self.yml"))
+  utils.mkdirp(os.path.join(projects, "7h3rAm.github.io", "static", "files", "pages_stats"))
+  utils.mkdirp(os.path.join(projects, "samhita", "blog", "drafts"))
+  postsdir = os.path.join(projects, "samhita", "blog", "posts")
+  utils.mkdirp(postsdir)
+  rng = random.Random(seed)
+  for idx in range(count):
+    with open(os.path.join(postsdir, "synthetic%05d.md" % (idx)), "w") as fp:
+      fp.write(corpus_post(rng, idx))
+  return home, projects
+
+
+def reset_build(home, projects):
+  # drop caches, manifest and rendered posts so the next build starts cold
+  shutil.rmtree(os.path.join(home, ".cache"), ignore_errors=True)
+  shutil.rmtree(os.path.join(projects, "7h3rAm.github.io", "posts"), ignore_errors=True)
+
+
+def run_build(home, projects, extra=[], memory=False):
+  # one kalpi process per build so caches and peak memory do not leak between runs
+  profile = os.path.join(home, "profile.json")
+  env = dict(os.environ, HOME=home, PROJECTSDIR=projects)
+  start = time.perf_counter()
+  proc = subprocess.run([sys.executable, os.path.join(basedir, "kalpi.py"), "--fast", "--profile", profile] + ([] if memory else ["--no-trace-memory"]) + extra, cwd=basedir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+  elapsed = time.perf_counter() - start
+  if proc.returncode != 0:
+    raise Exception(proc.stderr.strip().split("\n")[-1])
+  report = utils.load_json(profile)
+  return {
+    "seconds": elapsed,
+    "phases": report["phases"],
+    "posts": len(report["items"].get("posts", {})),
+  }
+
+
+def bench_corpus(sizes=[100, 1000, 10000], jobs=1, memory=True, keep=False):
+  results = {"corpus": {}}
+  for count in sizes:
+    workdir = tempfile.mkdtemp(prefix="kalpi-bench-%d-" % (count))
+    builds = {}
+    try:
+      start = time.perf_counter()
+      home, projects = make_corpus(workdir, count)
+      utils.info("generated %d posts in %.1fs under %s" % (count, time.perf_counter()-start, workdir))
+      if memory:
+        # tracemalloc slows allocation heavy phases down a lot, peak memory comes from its own cold build
+        builds["memory"] = run_build(home, projects, extra=["--jobs", str(jobs)], memory=True)
+        reset_build(home, projects)
+      # cold renders everything, warm re-runs against the caches and manifest the cold build left behind
+      builds["cold"] = run_build(home, projects, extra=["--jobs", str(jobs)])
+      builds["warm"] = run_build(home, projects, extra=["--jobs", str(jobs)])
+    finally:
+      if not keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    results["corpus"][str(count)] = builds
+
+    rows = []
+    for build in ["cold", "warm"]:
+      result = builds[build]
+      for phase in sorted(result["phases"], key=lambda x: result["phases"][x]["seconds"], reverse=True):
+        seconds = result["phases"][phase]["seconds"]
+        peak = utils.sizeof_fmt(builds["memory"]["phases"][phase]["peak_bytes"]) if build == "cold" and "memory" in builds and phase in builds["memory"]["phases"] else "-"
+        rows.append("%s___%s___%.3f___%s___%s" % (build, phase, seconds, "%.0f" % (count/seconds) if phase in ["get_tree", "render"] and seconds else "-", peak))
+      rows.append("%s___total___%.3f___%.0f___-" % (build, result["seconds"], count/result["seconds"]))
+    utils.to_table(["Build (%d posts)" % (count), "Phase", "Seconds", "Posts/s", "Peak"], rows, aligndict={"Build (%d posts)" % (count): "l", "Phase": "l", "Seconds": "r", "Posts/s": "r", "Peak": "r"})
+  return results
+
+
+def bench_minify(runs=5, top=10):
+  # htmlmin against the regex minifier on the pages the last build wrote, best of runs per file
+  import htmlmin
+  outputdir = os.path.join(utils.expand_env(var="$PROJECTSDIR"), "7h3rAm.github.io")
+  files = sorted([x for pattern in ["*.html", "pages/*.html", "posts/*.html"] for x in glob.glob(os.path.join(outputdir, pattern))], key=os.path.getsize, reverse=True)
+  minifiers = {
+    "htmlmin": lambda html: htmlmin.minify(html, remove_comments=True, remove_empty_space=True),
+    "fast": lambda html: utils.minify_html(html, remove_comments=True, remove_empty_space=True),
+  }
+  results = {"minify": {"files": len(files), "bytes": 0, "htmlmin": {"seconds": 0, "bytes": 0}, "fast": {"seconds": 0, "bytes": 0}}}
+  rows = []
+  for idx, filename in enumerate(files):
+    html = utils.file_open(filename)
+    results["minify"]["bytes"] += len(html)
+    row = {}
+    for name in minifiers:
+      timings = []
+      for _ in range(runs):
+        start = time.perf_counter()
+        output = minifiers[name](html)
+        timings.append(time.perf_counter() - start)
+      row[name] = (min(timings), len(output))
+      results["minify"][name]["seconds"] += min(timings)
+      results["minify"][name]["bytes"] += len(output)
+    if idx < top:
+      rows.append("%s___%s___%.2f___%.2f___%.1fx___%s___%s" % (filename.replace(outputdir, ""), utils.sizeof_fmt(len(html)), row["htmlmin"][0]*1000, row["fast"][0]*1000, row["htmlmin"][0]/row["fast"][0] if row["fast"][0] else 0, utils.sizeof_fmt(row["htmlmin"][1]), utils.sizeof_fmt(row["fast"][1])))
+  result = results["minify"]
+  rows.append("total (%d files)___%s___%.2f___%.2f___%.1fx___%s___%s" % (len(files), utils.sizeof_fmt(result["bytes"]), result["htmlmin"]["seconds"]*1000, result["fast"]["seconds"]*1000, result["htmlmin"]["seconds"]/result["fast"]["seconds"] if result["fast"]["seconds"] else 0, utils.sizeof_fmt(result["htmlmin"]["bytes"]), utils.sizeof_fmt(result["fast"]["bytes"])))
+  utils.to_table(["Page", "Size", "htmlmin (ms)", "fast (ms)", "Speedup", "htmlmin size", "fast size"], rows, aligndict={"Page": "l", "Size": "r", "htmlmin (ms)": "r", "fast (ms)": "r", "Speedup": "r", "htmlmin size": "r", "fast size": "r"})
+  return results
+
+
+def compare(results, baseline, threshold=10):
+  # seconds and peak memory per phase against a saved run, changes beyond threshold percent are flagged
+  rows = []
+  mindelta = {"seconds": 0.01, "peak_bytes": 1024*1024}
+  for count in results.get("corpus", {}):
+    for build in results["corpus"][count]:
+      old = baseline.get("corpus", {}).get(count, {}).get(build)
+      if not old:
+        continue
+      for phase in results["corpus"][count][build]["phases"]:
+        if phase not in old["phases"]:
+          continue
+        for metric in (["peak_bytes"] if build == "memory" else ["seconds"]):
+          before, after = old["phases"][phase][metric], results["corpus"][count][build]["phases"][phase][metric]
+          delta = (after-before)*100/before if before else 0
+          # sub 10ms and sub 1MiB moves are noise whatever their percentage
+          flag = "" if abs(after-before) < mindelta[metric] else "regressed" if delta > threshold else "improved" if delta < -threshold else ""
+          rows.append("%s/%s___%s___%s___%.4g___%.4g___%+.1f%%___%s" % (count, build, phase, metric, before, after, delta, flag))
+  for name in results.get("startup", {}):
+    if name in baseline.get("startup", {}):
+      before, after = baseline["startup"][name]["median"], results["startup"][name]["median"]
+      delta = (after-before)*100/before if before else 0
+      rows.append("startup___%s___median ms___%.4g___%.4g___%+.1f%%___%s" % (name, before, after, delta, "regressed" if delta > threshold else "improved" if delta < -threshold else ""))
+  for name in ["htmlmin", "fast"]:
+    if name in results.get("minify", {}) and name in baseline.get("minify", {}):
+      before, after = baseline["minify"][name]["seconds"], results["minify"][name]["seconds"]
+      delta = (after-before)*100/before if before else 0
+      rows.append("minify___%s___seconds___%.4g___%.4g___%+.1f%%___%s" % (name, before, after, delta, "regressed" if delta > threshold else "improved" if delta < -threshold else ""))
+  utils.to_table(["Run", "Phase", "Metric", "Before", "After", "Delta", ""], rows, aligndict={"Run": "l", "Phase": "l", "Metric": "l", "Before": "r", "After": "r", "Delta": "r", "": "l"})
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="%s (v%s)" % (utils.blue_bold("kalpi bench"), utils.green_bold("0.1")))
+  parser.add_argument("--startup", action="store_true", help="time interpreter startup and import cost (default when no suite is given)")
+  parser.add_argument("--corpus", metavar="SIZES", nargs="?", const="100,1000,10000", help="build synthetic corpora of these post counts (default: 100,1000,10000)")
+  parser.add_argument("--minify", action="store_true", help="time htmlmin and the fast minifier on the pages of the last build")
+  parser.add_argument("--runs", metavar="N", type=int, default=10, help="timed runs per command or page (default: 10)")
+  parser.add_argument("--jobs", metavar="N", type=int, default=1, help="--jobs passed to corpus builds")
+  parser.add_argument("--no-memory", action="store_true", help="skip the traced corpus build that measures peak memory per phase")
+  parser.add_argument("--keep", action="store_true", help="keep the generated corpora")
+  parser.add_argument("--output", metavar="FILE", help="save results as json")
+  parser.add_argument("--compare", metavar="FILE", help="compare against results saved with --output")
+  args = parser.parse_args()
+
+  results = {}
+  if args.startup or not (args.corpus or args.minify):
+    results.update(bench_startup(runs=args.runs))
+  if args.corpus:
+    results.update(bench_corpus(sizes=[int(x) for x in args.corpus.split(",")], jobs=args.jobs, memory=not args.no_memory, keep=args.keep))
+  if args.minify:
+    results.update(bench_minify(runs=args.runs))
+  if args.compare:
+    compare(results, utils.load_json(args.compare))
+  if args.output:
+    utils.save_json(results, args.output)
+    utils.info("saved results to %s" % (args.output))
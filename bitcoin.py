@@ -141,7 +141,7 @@ class Bitcoin:
 
   def query_address(self, address, explorer="blockchaininfomulti"):
     if explorer == "chainso":
-      content = utils.get_http("https://chain.so/api/v2/address/BTC/%s" % (address))
+      content = utils.get_http("https://chain.so/api/v2/address/BTC/%s" % (address), ttl=600)
       if "data" in content and len(content["data"]["txs"]):
         return {
           "balance": int(float(content["data"]["balance"]) * (10**8)),
@@ -152,7 +152,7 @@ class Bitcoin:
           "lastseen": time.strftime("%d/%b/%Y @ %H:%M:%S %Z", time.localtime(content["data"]["txs"][0]["time"])),
         }
     elif explorer == "blockchaininfo":
-      content = utils.get_http("https://blockchain.info/rawaddr/%s" % (address))
+      content = utils.get_http("https://blockchain.info/rawaddr/%s" % (address), ttl=600)
       if "n_tx" in content:
         return {
           "transaction": content["n_tx"],
@@ -163,7 +163,7 @@ class Bitcoin:
           "lastseen": time.strftime("%d/%b/%Y @ %H:%M:%S %Z", time.localtime(content["txs"][0]["time"])) if len(content["txs"]) else "",
         }
     elif explorer == "blockchaininfomulti":
-      content = utils.get_http("https://blockchain.info/multiaddr?active=%s" % (address))
+      content = utils.get_http("https://blockchain.info/multiaddr?active=%s" % (address), ttl=600)
       if "addresses" in content and content["addresses"][0]["address"] == address:
         return {
           "transaction": content["addresses"][0]["n_tx"],
@@ -179,7 +179,7 @@ class Bitcoin:
     chunks = list(utils.chunkify(list(self.addresses["category"][category].keys()), 50))
     print("performing lookup for %d chunks of %d %s addresses" % (len(chunks), len(list(self.addresses["category"][category].keys())), category))
     for chunk in chunks:
-      stats = utils.get_http("https://blockchain.info/multiaddr?active=%s" % ("|".join(chunk)))
+      stats = utils.get_http("https://blockchain.info/multiaddr?active=%s" % ("|".join(chunk)), ttl=600)
       if "addresses" in stats:
         for entry in stats["addresses"]:
           foundaddresses.append(entry["address"])
@@ -452,7 +452,7 @@ class Bitcoin:
       for wallet in self.bitcoin["category"][category]:
         try:
           # https://www.blockchain.com/api/blockchain_api
-          stats = utils.get_http("https://blockchain.info/multiaddr?active=%s" % ("|".join(self.bitcoin["category"][category][wallet]["addresses"])))
+          stats = utils.get_http("https://blockchain.info/multiaddr?active=%s" % ("|".join(self.bitcoin["category"][category][wallet]["addresses"])), ttl=600)
         except:
           stats= None
         if stats and "addresses" in stats:
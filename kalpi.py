@@ -3,30 +3,266 @@
 import os
 import re
 import glob
+import json
 import time
 import shutil
+import threading
+import tracemalloc
+import urllib.parse
+import collections.abc
+import concurrent.futures
 import random
+import array
+import heapq
 import hashlib
-import htmlmin
 import argparse
-import markdown
 import sparkline
 import dateutil.relativedelta
 import yaml
-import requests
 from datetime import datetime
-from jinja2 import Environment, BaseLoader, FileSystemLoader
-from bs4 import BeautifulSoup
 
 import utils
 
 
+worker = None
+
+
+def init_worker(klp=None):
+  global worker
+  worker = klp
+  # forked workers inherit --profile memory tracing, which only the parent reports
+  if tracemalloc.is_tracing():
+    tracemalloc.stop()
+
+
+def run_worker_task(task):
+  return worker.run_task(task)
+
+
+class Post:
+  """a parsed post, fields live in slots and item access keeps dict style callers and templates working"""
+  __slots__ = ["id", "path", "loader", "body", "digest", "title", "epoch", "url", "pretty_date", "sdate", "date", "year", "month", "day", "tags", "summary", "filename", "sparkline", "sparklinelong", "reading_time", "reading_bar", "word_count", "code_blocks", "rss_date", "previous", "next", "is_draft"]
+
+  def __init__(self, **fields):
+    self.id = None
+    self.body = None
+    for key in fields:
+      setattr(self, key, fields[key])
+
+  def __getitem__(self, key):
+    try:
+      return getattr(self, key)
+    except AttributeError:
+      raise KeyError(key)
+
+  def __setitem__(self, key, value):
+    setattr(self, key, value)
+
+  def __contains__(self, key):
+    return hasattr(self, key)
+
+  def get(self, key, default=None):
+    return getattr(self, key, default)
+
+  # bodies are not kept, they load from path on access unless a render holds them in body meanwhile
+  @property
+  def contentmd(self):
+    return (self.body or self.loader(self.path, render=False))[0]
+
+  @property
+  def content(self):
+    return (self.body or self.loader(self.path))[1]
+
+  def member(self):
+    # what another page renders of this post, the digest covers everything but unseeded sparklines
+    return [self.url, self.digest, self.sparkline]
+
+  def keys(self):
+    return [x for x in self.__slots__ if x not in ["id", "path", "loader", "body"] and hasattr(self, x)] + ["contentmd", "content"]
+
+  def jsonable(self):
+    # digest already covers the title and markdown body
+    return {x: getattr(self, x) for x in self.keys() if x not in ["contentmd", "content"]}
+
+
+class TagView(collections.abc.Sequence):
+  """posts carrying a tag, post ids resolved against the store on access"""
+  def __init__(self, store, ids):
+    self.store = store
+    self.ids = ids
+
+  def __getitem__(self, idx):
+    if isinstance(idx, slice):
+      return [self.store.posts[x] for x in self.ids[idx]]
+    return self.store.posts[self.ids[idx]]
+
+  def __len__(self):
+    return len(self.ids)
+
+  def jsonable(self):
+    # pages may read tags without posts, members carry what their rows render
+    return [self.store.posts[x].member() for x in self.ids]
+
+
+class PostStore:
+  """every post of a build by integer id, with tag -> ids and url -> id indexes"""
+  def __init__(self):
+    self.posts = []
+    self.tags = {}
+    self.urls = {}
+
+  def add(self, post):
+    post.id = len(self.posts)
+    self.posts.append(post)
+    self.urls[post.url] = post.id
+    for tag in post.tags:
+      self.tags.setdefault(tag, []).append(post.id)
+    return post
+
+  def find(self, url):
+    return self.posts[self.urls[url]] if url in self.urls else None
+
+  def tagged(self, tag):
+    return TagView(self, self.tags.get(tag, []))
+
+  def tagviews(self):
+    return {tag: self.tagged(tag) for tag in self.tags}
+
+
+class PostStats:
+  """per post metrics in columns keyed by source path, with year, month and tag counters kept in step so a changed post only updates its own slot"""
+  def __init__(self):
+    self.slots = {}
+    self.free = []
+    self.order = []
+    self.digests, self.titles, self.urls, self.dates, self.tags = [], [], [], [], []
+    self.words, self.codeblocks = array.array("l"), array.array("l")
+    self.per_yyyymm, self.per_yyyy, self.per_tag = collections.Counter(), collections.Counter(), collections.Counter()
+    # (group, tag) -> posts, distinct tags per group are the keys still counted
+    self.tags_yyyymm, self.tags_yyyy = collections.Counter(), collections.Counter()
+    self.tagsum_yyyymm, self.tagsum_yyyy = collections.Counter(), collections.Counter()
+
+  def bump(self, counter, key, delta):
+    counter[key] += delta
+    if not counter[key]:
+      del counter[key]
+
+  def count(self, slot, delta):
+    yyyymm, yyyy = self.dates[slot][:6], self.dates[slot][:4]
+    tags = self.tags[slot]
+    self.bump(self.per_yyyymm, yyyymm, delta)
+    self.bump(self.per_yyyy, yyyy, delta)
+    self.bump(self.tagsum_yyyymm, yyyymm, delta*len(tags))
+    self.bump(self.tagsum_yyyy, yyyy, delta*len(tags))
+    for tag in tags:
+      self.bump(self.per_tag, tag, delta)
+      self.bump(self.tags_yyyymm, (yyyymm, tag), delta)
+      self.bump(self.tags_yyyy, (yyyy, tag), delta)
+
+  def add(self, post):
+    row = [post.digest, post.title, post.url, "%04d%02d%02d" % (post.year, post.month, post.day), list(post.tags), post.word_count, post.code_blocks]
+    if self.free:
+      slot = self.free.pop()
+      for column, value in zip([self.digests, self.titles, self.urls, self.dates, self.tags, self.words, self.codeblocks], row):
+        column[slot] = value
+    else:
+      slot = len(self.urls)
+      for column, value in zip([self.digests, self.titles, self.urls, self.dates, self.tags, self.words, self.codeblocks], row):
+        column.append(value)
+    self.slots[post.path] = slot
+    self.count(slot, 1)
+
+  def remove(self, path):
+    slot = self.slots.pop(path)
+    self.count(slot, -1)
+    self.free.append(slot)
+
+  def sync(self, posts):
+    """bring the columns in line with posts, whose order summaries follow"""
+    # paths are unique where urls are not, a post and a draft of the same name share one under --drafts
+    current = {post.path: post.digest for post in posts}
+    for path in [path for path in self.slots if current.get(path) != self.digests[self.slots[path]]]:
+      self.remove(path)
+    for post in posts:
+      if post.path not in self.slots:
+        self.add(post)
+    self.order = [self.slots[post.path] for post in posts]
+
+  def grouped(self, keys, posts, tagsum, tagpairs):
+    tagslists = {}
+    for group, tag in tagpairs:
+      tagslists.setdefault(group, []).append(tag)
+    return {key: {"posts": posts[key], "tagslist": sorted(tagslists.get(key, [])), "tags": tagsum[key]} for key in keys}
+
+  def summary(self):
+    """the stats dict gen_stats hands to templates, groups and ties follow the order posts were synced in"""
+    months, years, tags = {}, {}, {}
+    dates, details = [], []
+    for slot in self.order:
+      date = self.dates[slot]
+      dates.append(date)
+      months.setdefault(date[:6], None)
+      years.setdefault(date[:4], None)
+      for tag in self.tags[slot]:
+        tags.setdefault(tag, None)
+      details.append({
+        "title": self.titles[slot],
+        "url": self.urls[slot],
+        "words": self.words[slot],
+        "code_blocks": self.codeblocks[slot],
+        "tags_count": len(self.tags[slot]),
+        "date": "%s-%s-%s" % (date[:4], date[4:6], date[6:]),
+        "reading_time": max(1, int(self.words[slot] / 200)),
+      })
+    stats = {
+      "count_posts": len(self.order),
+      "count_tags": len(self.per_tag),
+      "groups": {
+        "per_yyyymm": self.grouped(months, self.per_yyyymm, self.tagsum_yyyymm, self.tags_yyyymm),
+        "per_yyyy": self.grouped(years, self.per_yyyy, self.tagsum_yyyy, self.tags_yyyy),
+        "per_tag": {tag: {"posts": self.per_tag[tag]} for tag in tags},
+      },
+      "duration": {
+        "start_year": min([int(x) for x in years] + [2100]),
+        "end_year": max([int(x) for x in years] + [2000]),
+      },
+      "dates": dates,
+      "word_counts": [x["words"] for x in details],
+      "code_blocks": [x["code_blocks"] for x in details],
+      "post_details": details,
+    }
+    stats["most_used_tag"] = max(tags, key=self.per_tag.__getitem__)
+    stats["least_used_tag"] = min(tags, key=self.per_tag.__getitem__)
+    stats["max_posts_yyyy"] = max(years, key=self.per_yyyy.__getitem__)
+    stats["min_posts_yyyy"] = min(years, key=self.per_yyyy.__getitem__)
+    stats["max_tags_yyyy"] = max(years, key=lambda key: len(stats["groups"]["per_yyyy"][key]["tagslist"]))
+    stats["min_tags_yyyy"] = min(years, key=lambda key: len(stats["groups"]["per_yyyy"][key]["tagslist"]))
+    # nlargest and nsmallest keep sorted()'s order among equal word counts
+    longest = heapq.nlargest(10, details, key=lambda x: x["words"])
+    shortest = heapq.nsmallest(10, details, key=lambda x: x["words"])
+    stats["content_metrics"] = {
+      "total_words": sum(stats["word_counts"]),
+      "avg_words": int(sum(stats["word_counts"]) / len(details)) if details else 0,
+      "min_words": shortest[0]["words"] if details else 0,
+      "max_words": longest[0]["words"] if details else 0,
+      "total_code_blocks": sum(stats["code_blocks"]),
+      "longest_post": longest[0] if details else None,
+      "shortest_post": shortest[0] if details else None,
+      "top_10_longest": longest,
+      "top_10_shortest": shortest,
+    }
+    stats["avg_posts_per_year"] = int(len(details)/len(years))
+    stats["avg_posts_per_tag"] = int(sum(self.per_tag.values())/len(tags))
+    return stats
+
+
 class Kalpi:
   def __init__(self):
     self.datadict = {}
 
     self.datadict["tags"] = {}
     self.datadict["posts"] = {}
+    self.store = PostStore()
     self.datadict["recent_count"] = 10
     self.basedir = "%s/7h3rAm.github.io" % (utils.expand_env(var="$PROJECTSDIR"))
     self.outputdir = self.basedir
@@ -34,6 +270,17 @@ class Kalpi:
     self.draftsdir = "%s/samhita/blog/drafts" % (utils.expand_env(var="$PROJECTSDIR"))
     self.templatesdir = "%s/_templates" % (self.basedir)
     self.statsdir = "%s/static/files/pages_stats" % (self.outputdir)
+    self.cachedir = "%s/.cache/kalpi" % (utils.expand_env(var="$HOME"))
+    self.manifestfile = "%s/manifest.json" % (self.cachedir)
+    self.jinjacachedir = "%s/jinja" % (self.cachedir)
+    self.mdcache = utils.DiskCache("%s/markdown" % (self.cachedir), maxsize=128*1024*1024)
+    self.minifycache = utils.DiskCache("%s/minify" % (self.cachedir), maxsize=128*1024*1024)
+    self.minifier = "htmlmin"
+    self.minifyversion = None
+    self.searchfile = "%s/search.json" % (self.cachedir)
+    self.searchterms = None
+    self.searchdir = "%s/static/search" % (self.outputdir)
+    self.mdextensions = ["fenced_code", "footnotes", "tables"]
 
     self.pages = {}
     self.pages["research"] = "%s/research.md" % (self.templatesdir)
@@ -42,15 +289,6 @@ class Kalpi:
     self.pages["fitness"] = "%s/fitness.md" % (self.templatesdir)
 
     self.datadict["pages"] = {}
-    self.datadict["metadata"] = utils.load_yaml("%s/bootstrap/self.yml" % (utils.expand_env(var="$HOME")))["metadata"]
-    # Load CV YAML - handle multi-document format (---...---)
-    with open("%s/cv/AnkurTyagi.yml" % (utils.expand_env(var="$PROJECTSDIR"))) as f:
-      self.datadict["cv"] = list(yaml.safe_load_all(f))[0]
-    self.datadict["fitness"] = utils.load_yaml("%s/fitness.yml" % (self.templatesdir))
-    self.datadict["life"] = utils.load_yaml("%s/life.yml" % (self.templatesdir))
-    self.datadict["oscp"] = utils.load_yaml("%s/oscp.yml" % (self.templatesdir))
-    self.datadict["read"] = utils.load_yaml("%s/read.yml" % (self.templatesdir))
-    self.datadict["startpage"] = utils.load_yaml("%s/startpage.yml" % (self.templatesdir))
 
     self.templatemapping = {
       "index.html": "%s/index.html" % (self.outputdir),
@@ -79,6 +317,74 @@ class Kalpi:
     self.totalsize = 0
     self.minsize = 0
 
+    self.rebuild = False
+    self.manifest = {"posts": {}, "pages": {}, "charts": {}, "search": {}, "searchids": {}, "assets": {}, "images": {}, "bodies": {}}
+    self.templatedeps = {}
+    self.datadigests = {}
+    self.env = None
+    self.stringenv = None
+    self.stringtemplates = {}
+    self.jobs = 1
+    self.pagesize = 0
+    self.seed = None
+    self.inlinestyles = False
+    self.stylesheet = "/static/css/kalpi.css"
+    self.sparkcolors = ["#007bff", "#00bcd4", "#17a2b8", "#20c997", "#2196f3", "#28a745", "#4caf50", "#6610f2", "#6c757d", "#6f42c1", "#8357ff", "#dc3545", "#e83e8c", "#f44336", "#fd7e14", "#ffc107", "#20b2aa", "#99cc99", "#0c9", "#5b92e5", "#ffcc66", "#00b7eb", "#69359c", "#fe4164", "#a50b5e"]
+    self.cloudcolors = ["#20b2aa", "#99cc99", "#0c9", "#5b92e5", "#ffcc66", "#00b7eb", "#69359c", "#fe4164", "#a50b5e"]
+    # font size and weight per tag cloud tier, a tag lands in the first tier its share of the top tag's count fits in
+    self.cloudtiers = [["0.9em", False], ["1.1em", True], ["1.3em", False], ["1.5em", True], ["1.7em", False], ["1.9em", True], ["2.1em", False], ["2.3em", True], ["2.5em", False], ["2.7em", True]]
+    self.fetch_timeout = 30
+    self.treecache = {}
+    self.poststats = PostStats()
+    self.usedbodies = set()
+    self.seentree = set()
+    self.memory = None
+    self.chartpool = None
+    self.chartjobs = {}
+    self.profiler = utils.Profiler()
+    self.assets = {}
+    self.imagewidths = [320, 640, 1024, 1600]
+    self.imagequality = 80
+
+    # post html stages, applied in order, literal ones as str.replace
+    self.stages = []
+    self.stagetimes = {}
+    for level in range(1, 7):
+      self.add_stage("headings", '<h%d>' % (level), '<h%d class="h%d collapsible" onclick="toggle(this);">' % (level, level), literal=True)
+    self.add_stage("lists", '<ul>', '<ul class="nested active">', literal=True)
+    self.add_stage("lists", '<ol>', '<ol class="nested active">', literal=True)
+    self.add_stage("paragraphs", '<p>', '<p class="nested active">', literal=True)
+    self.add_stage("code", '<pre><code>', '<pre class="nested active"><code>', literal=True)
+    self.add_stage("code", '<pre><code class="', '<pre class="nested active"><code class="', literal=True)
+    self.add_stage("paragraphs", '<p class="nested active"><a href="/posts/', '<p><a href="/posts/', literal=True)
+    self.add_stage("paragraphs", '<p class="nested active">published on ', '<p>published on ', literal=True)
+    self.add_stage("paragraphs", '<p class="nested active">tagged ', '<p>tagged ', literal=True)
+    self.add_stage("links", '](https://7h3ram.github.io/posts/', '](/posts/', literal=True)
+    self.add_stage("links", 'href="https://7h3ram.github.io/posts/', 'href="/posts/', literal=True)
+    self.add_stage("tabs", r'<!--\s*tabs\s+(.*?)-->(.*?)<!--\s*/tabs\s*-->', self.tab_group, flags=re.DOTALL)
+    self.add_stage("images", r'<img\s[^>]*>', self.image_srcset)
+    self.rendered = 0
+    self.unchanged = 0
+    self.written = 0
+    self.skipped = 0
+
+  def load_data(self):
+    self.datadict["metadata"] = utils.load_yaml("%s/bootstrap/self.yml" % (utils.expand_env(var="$HOME")))["metadata"]
+    # Load CV YAML - handle multi-document format (---...---)
+    with open("%s/cv/AnkurTyagi.yml" % (utils.expand_env(var="$PROJECTSDIR"))) as f:
+      self.datadict["cv"] = list(yaml.safe_load_all(f))[0]
+    self.datadict["fitness"] = utils.load_yaml("%s/fitness.yml" % (self.templatesdir))
+    self.datadict["life"] = utils.load_yaml("%s/life.yml" % (self.templatesdir))
+    self.datadict["oscp"] = utils.load_yaml("%s/oscp.yml" % (self.templatesdir))
+    self.datadict["read"] = utils.load_yaml("%s/read.yml" % (self.templatesdir))
+    self.datadict["startpage"] = utils.load_yaml("%s/startpage.yml" % (self.templatesdir))
+
+  def __getstate__(self):
+    # compiled templates do not pickle, worker processes build their own environment
+    state = self.__dict__.copy()
+    state.update({"env": None, "stringenv": None, "stringtemplates": {}, "chartpool": None, "chartjobs": {}, "profiler": utils.Profiler(), "searchterms": None})
+    return state
+
   def join_list(self, inlist, url="/tags.html#"):
     outlist = []
     for item in sorted(inlist):
@@ -103,7 +409,14 @@ class Kalpi:
     return mdtext.replace('\n```\n', '\n```c\n') if "\n```\n" in mdtext else mdtext
 
   def md2html(self, mdtext):
-    return markdown.markdown(mdtext, extensions=["fenced_code", "footnotes", "tables"])
+    import markdown
+    return markdown.markdown(mdtext, extensions=self.mdextensions)
+
+  def md2html_cached(self, mdtext):
+    import markdown
+    key = self.digest([mdtext, self.mdextensions, markdown.__version__])
+    html = self.mdcache.get(key)
+    return html if html is not None else self.mdcache.put(key, self.md2html(mdtext))
 
   def clean_text(self, rgx_list, text, subtext=""):
     # https://stackoverflow.com/a/37192727/1079836
@@ -118,8 +431,105 @@ class Kalpi:
   def remove_empty_ul(self, htmltext):
     return self.clean_text([r"</li>\s*</ul>\s*<ul>\s*<li>"], text=self.clean_text([r"<p>\s*</p>"], text=htmltext), subtext="</li><li>")
 
-  def get_template(self, templatefile, datadict):
-    env = Environment(loader=FileSystemLoader(self.templatesdir), extensions=["jinja2_markdown.MarkdownExtension"], autoescape=False)
+  def digest(self, data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=self.jsonable).encode("utf-8")).hexdigest()
+
+  def jsonable(self, obj):
+    # posts and tag views digest as the fields and urls they stand for
+    return obj.jsonable() if hasattr(obj, "jsonable") else str(obj)
+
+  def template_deps(self, templatefile):
+    """digest of the templates templatefile extends, includes or imports (itself included) and the datadict keys they read"""
+    # keys is None when a template uses datadict as a whole or with a computed key, the page then depends on all of it
+    if templatefile not in self.templatedeps:
+      from jinja2 import meta, nodes
+      env = self.get_env()
+      sources, keys, pending = {}, set(), [templatefile]
+      # tags the template looks up one at a time, None once it reads the whole index
+      tags = set()
+      while pending:
+        name = pending.pop()
+        if name in sources:
+          continue
+        sources[name] = env.loader.get_source(env, name)[0]
+        ast = env.parse(sources[name])
+        for reference in meta.find_referenced_templates(ast):
+          if reference is None:
+            # a computed template name could be any of them
+            pending += [os.path.basename(x) for x in glob.glob("%s/*.html" % (self.templatesdir)) + glob.glob("%s/*.xml" % (self.templatesdir))]
+          else:
+            pending.append(reference)
+        direct = set()
+        for node in list(ast.find_all(nodes.Getattr)) + list(ast.find_all(nodes.Getitem)):
+          if isinstance(node.node, nodes.Name) and node.node.name == "datadict":
+            direct.add(id(node.node))
+            if isinstance(node, nodes.Getattr):
+              keys = keys if keys is None else keys | {node.attr}
+            elif isinstance(node.arg, nodes.Const):
+              keys = keys if keys is None else keys | {node.arg.value}
+            else:
+              keys = None
+        if [x for x in ast.find_all(nodes.Name) if x.name == "datadict" and id(x) not in direct]:
+          keys = None
+        lookups = set()
+        for node in ast.find_all(nodes.Getitem):
+          if isinstance(node.node, nodes.Getattr) and node.node.attr == "tags" and isinstance(node.node.node, nodes.Name) and node.node.node.name == "datadict":
+            lookups.add(id(node.node))
+            # a loop variable stands for the tags the page renders itself, anything else could be any tag
+            if tags is None:
+              continue
+            elif isinstance(node.arg, nodes.Const):
+              tags = tags | {node.arg.value}
+            elif isinstance(node.arg, nodes.Name):
+              tags = tags | {None}
+            else:
+              tags = None
+        if [x for x in ast.find_all(nodes.Getattr) if x.attr == "tags" and isinstance(x.node, nodes.Name) and x.node.name == "datadict" and id(x) not in lookups]:
+          tags = None
+      self.templatedeps[templatefile] = (self.digest(sources), sorted(keys) if keys is not None else None, None if keys is None else tags)
+    return self.templatedeps[templatefile][:2]
+
+  def tag_scope(self, templatefile):
+    """tags templatefile reads from datadict.tags one by one, None standing for the page's own tags, or None when it may read any"""
+    self.template_deps(templatefile)
+    return self.templatedeps[templatefile][2]
+
+  def data_digest(self, keys):
+    # each key is digested once per build however many pages read it
+    for key in [x for x in (self.datadict if keys is None else keys) if x not in self.datadigests]:
+      self.datadigests[key] = self.digest(self.datadict.get(key))
+    return self.digest({key: self.datadigests[key] for key in (self.datadict if keys is None else keys)})
+
+  def load_manifest(self):
+    """Load the build manifest recording the inputs each output was last rendered from"""
+    if self.memory is not None:
+      # --serve keeps its manifest in memory next to the outputs it describes
+      pass
+    elif not self.rebuild and os.path.isfile(self.manifestfile):
+      self.manifest = utils.load_json(self.manifestfile)
+    for kind in ["posts", "pages", "charts", "search", "searchids", "assets", "images", "bodies"]:
+      self.manifest.setdefault(kind, {})
+
+  def save_manifest(self):
+    if self.memory is not None:
+      return
+    utils.mkdirp(self.cachedir)
+    utils.save_json(self.manifest, self.manifestfile)
+
+  def is_fresh(self, kind, filename, inputs):
+    exists = filename in self.memory if self.memory is not None else os.path.isfile(filename)
+    return exists and self.manifest[kind].get(filename) == inputs
+
+  def save_output(self, filename, html):
+    """returns True when the output changed, unchanged files on disk are left untouched"""
+    if self.memory is not None:
+      # --serve keeps outputs in memory, drafts never end up in the site repo
+      changed = self.memory.get(filename) != html
+      self.memory[filename] = html
+      return changed
+    return utils.file_save(filename, html)
+
+  def setup_env(self, env):
     env.trim_blocks = True
     env.lsrtip_blocks = True
     env.filters["md2html"] = self.md2html
@@ -128,74 +538,166 @@ class Kalpi:
     env.filters["joinlist"] = self.join_list
     env.filters["joinlistand"] = self.join_list_and
     env.filters["trimlength"] = self.trim_length
-    return env.get_template(templatefile).render(datadict=datadict)
-
-  def render_template(self, templatefile, postprocess=[]):
-    if templatefile in self.templatemapping:
-      output = self.get_template(templatefile, datadict=self.datadict)
-      output = output.replace('<div class="footer"></div>', '<div class="footer footercenter"><span><a href="https://creativecommons.org/licenses/by-sa/4.0/" class="footspan">  </a></span></div>')
-      html = output
-      if "minify" in postprocess:
-        html = htmlmin.minify(output, remove_comments=True, remove_empty_space=True)
-      utils.file_save(self.templatemapping[templatefile], html)
-      #utils.info("rendered '%s' (%s)" % (utils.cyan(self.templatemapping[templatefile]), utils.blue(utils.sizeof_fmt(len(html)))))
-      self.totalsize += len(output)
-      self.minsize += len(html)
+    env.filters["tagurl"] = self.tag_url
+    return env
+
+  def get_env(self):
+    # one environment per build, compiled templates are kept in memory and as bytecode on disk
+    if not self.env:
+      from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+      utils.mkdirp(self.jinjacachedir)
+      self.env = self.setup_env(Environment(loader=FileSystemLoader(self.templatesdir), extensions=["jinja2_markdown.MarkdownExtension"], autoescape=False, bytecode_cache=FileSystemBytecodeCache(self.jinjacachedir)))
+    return self.env
+
+  def minify(self, html):
+    """minify html with the configured minifier, results are cached by input digest"""
+    if self.minifier == "fast":
+      if not self.minifyversion:
+        # edits to the minifier or its patterns invalidate cached output, same as an htmlmin upgrade
+        import inspect
+        self.minifyversion = self.digest([inspect.getsource(utils.minify_text), inspect.getsource(utils.minify_html), [x.pattern for x in [utils.minify_blocks, utils.minify_empty, utils.minify_empty_lines, utils.minify_spaces, utils.minify_title]]])
+      key = self.digest([html, "fast", self.minifyversion])
     else:
-      utils.warn("could not find mapping for file '%s'" % (utils.red(templatefile)))
+      import htmlmin
+      key = self.digest([html, "htmlmin", htmlmin.__version__])
+    cached = self.minifycache.get(key)
+    if cached is not None:
+      return cached
+    if self.minifier == "fast":
+      return self.minifycache.put(key, utils.minify_html(html, remove_comments=True, remove_empty_space=True))
+    return self.minifycache.put(key, htmlmin.minify(html, remove_comments=True, remove_empty_space=True))
+
+  def postprocess_inputs(self, postprocess):
+    # switching minifiers changes minified outputs, switching to inline styles every output
+    return ["minify:%s" % (self.minifier) if x == "minify" else x for x in sorted(postprocess)] + (["inlinestyles"] if self.inlinestyles else [])
+
+  def get_template(self, templatefile, datadict):
+    return self.get_env().get_template(templatefile).render(datadict=datadict)
+
+  def render_template(self, templatefile, postprocess=[], filename=None, datadict=None):
+    timings = {}
+    start = time.perf_counter()
+    output = self.link_stylesheet(self.get_template(templatefile, datadict=datadict or self.datadict))
+    timings["template"] = time.perf_counter() - start
+    output = output.replace('<div class="footer"></div>', '<div class="footer footercenter"><span><a href="https://creativecommons.org/licenses/by-sa/4.0/" class="footspan">  </a></span></div>')
+    html = output
+    if "minify" in postprocess:
+      start = time.perf_counter()
+      html = self.minify(output)
+      timings["minify"] = time.perf_counter() - start
+    start = time.perf_counter()
+    written = self.save_output(filename or self.templatemapping[templatefile], html)
+    timings["write"] = time.perf_counter() - start
+    #utils.info("rendered '%s' (%s)" % (utils.cyan(self.templatemapping[templatefile]), utils.blue(utils.sizeof_fmt(len(html)))))
+    return len(output), len(html), written, timings
+
+  def render_post(self, post, postprocess=[]):
+    filename = "%s%s" % (self.outputdir, post["url"])
+    timings = {}
+    start = time.perf_counter()
+    # the body loads once for the render however often the template reads it
+    post.body = self.load_body(post.path)
+    try:
+      output = self.link_stylesheet(self.get_template("post.html", datadict={"metadata": self.datadict["metadata"], "post": post, "tags": self.datadict["tags"]}))
+    finally:
+      post.body = None
+    timings["template"] = time.perf_counter() - start
+    output = self.postprocess_html(output, timings)
+    #output = output.replace('BG_CLIPART_STYLE_HERE', 'class="bgclipart_sq" style="background-image: url(%s);"' % (random.choice(calist)))
+    html = output
+    if "minify" in postprocess:
+      start = time.perf_counter()
+      html = self.minify(output)
+      timings["minify"] = time.perf_counter() - start
+    start = time.perf_counter()
+    written = self.save_output(filename, html)
+    timings["write"] = time.perf_counter() - start
+    #utils.info("rendered '%s' (%s)" % (utils.magenta(filename), utils.blue(utils.sizeof_fmt(len(html)))))
+    return len(output), len(html), written, timings
+
+  def run_task(self, task):
+    start = time.perf_counter()
+    caches = [self.mdcache.hits, self.mdcache.misses, self.minifycache.hits, self.minifycache.misses]
+    if task[0] == "post":
+      result = self.render_post(self.datadict["posts"][task[1]], postprocess=task[2])
+    elif task[0] == "listing":
+      result = self.render_template(task[1], postprocess=task[2], filename=task[3], datadict=self.listing_datadict(task[4]))
+    else:
+      result = self.render_template(task[1], postprocess=task[2])
+    result[3]["total"] = time.perf_counter() - start
+    # cache lookups made on a worker only reach the summary through the result
+    return result + ([new - old for new, old in zip([self.mdcache.hits, self.mdcache.misses, self.minifycache.hits, self.minifycache.misses], caches)],)
+
+  def run_jobs(self, jobs):
+    """render queued (kind, filename, inputs, task) jobs, spread over worker processes with --jobs"""
+    tasks = [job[3] for job in jobs]
+    pooled = self.jobs > 1 and len(tasks) > 1
+    if pooled:
+      # workers get this instance (and datadict) once at startup, tasks only carry an index or a template name
+      with concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs, initializer=init_worker, initargs=(self,)) as pool:
+        results = list(pool.map(run_worker_task, tasks, chunksize=max(1, len(tasks)//(self.jobs*4))))
+    else:
+      results = [self.run_task(task) for task in tasks]
+    for (kind, filename, inputs, task), (total, minified, written, timings, caches) in zip(jobs, results):
+      if pooled:
+        self.mdcache.hits += caches[0]
+        self.mdcache.misses += caches[1]
+        self.minifycache.hits += caches[2]
+        self.minifycache.misses += caches[3]
+      self.totalsize += total
+      self.minsize += minified
+      self.written += 1 if written else 0
+      self.skipped += 0 if written else 1
+      for stage in timings:
+        if stage not in ["template", "write", "total"]:
+          self.stagetimes[stage] = self.stagetimes.get(stage, 0) + timings[stage]
+      self.profiler.record(kind, filename, timings)
+      self.manifest[kind][filename] = inputs
+      self.rendered += 1
 
   def render_template_string(self, templatestr):
-    env = Environment(loader=BaseLoader, extensions=["jinja2_markdown.MarkdownExtension"], autoescape=False)
-    env.trim_blocks = True
-    env.lsrtip_blocks = True
-    env.filters["md2html"] = self.md2html
-    env.filters["removepara"] = self.remove_para
-    env.filters["removeemptyul"] = self.remove_empty_ul
-    env.filters["joinlist"] = self.join_list
-    env.filters["joinlistand"] = self.join_list_and
-    env.filters["trimlength"] = self.trim_length
-    return env.from_string(htmlmin.minify(templatestr, remove_comments=True, remove_empty_space=True)).render(datadict=self.datadict)
+    if not self.stringenv:
+      from jinja2 import Environment, BaseLoader
+      self.stringenv = self.setup_env(Environment(loader=BaseLoader, extensions=["jinja2_markdown.MarkdownExtension"], autoescape=False))
+    if templatestr not in self.stringtemplates:
+      self.stringtemplates[templatestr] = self.stringenv.from_string(self.minify(templatestr))
+    return self.stringtemplates[templatestr].render(datadict=self.datadict)
+
+  def presentation_random(self, content):
+    """random for the colors and orderings that only dress up output, with a seed they follow it and the content instead"""
+    return random if self.seed is None else random.Random("%s:%s" % (self.seed, content))
 
   def tag_cloud(self):
-    colors = ["#20b2aa", "#99cc99", "#0c9", "#5b92e5", "#ffcc66", "#00b7eb", "#69359c", "#fe4164", "#a50b5e"]
-    random.shuffle(colors)
-    maxtagcount = 0
-    tags, tagcloud = {}, {}
+    """tag -> inline style, in cloud order"""
+    rng = self.presentation_random(self.digest(sorted([[tag, len(self.datadict["tags"][tag])] for tag in self.datadict["tags"]])))
+    colors = list(range(len(self.cloudcolors)))
+    rng.shuffle(colors)
+    maxtagcount = max([len(self.datadict["tags"][tag]) for tag in self.datadict["tags"]] + [1])
+    tagcloud = {}
     for tag in self.datadict["tags"]:
-      tagcloud[tag] = None
-      tags[tag] = len(self.datadict["tags"][tag])
-      if tags[tag] > maxtagcount:
-        maxtagcount = tags[tag]
-    for tag in tags:
-      percent = (tags[tag]*100/maxtagcount)
-      if percent <= 10:
-        tagcloud[tag] = "font-size:0.9em; color:%s; margin:0.1em 0.3em; line-height:2;" % (colors[0])
-      elif percent <= 20:
-        tagcloud[tag] = "font-size:1.1em; font-weight:bold; color:%s; margin:0.1em 0.3em; line-height:2;" % (colors[1])
-      elif percent <= 30:
-        tagcloud[tag] = "font-size:1.3em; color:%s; margin:0.1em 0.3em; line-height:2;" % (colors[2])
-      elif percent <= 40:
-        tagcloud[tag] = "font-size:1.5em; font-weight:bold; color:%s; margin:0.1em 0.3em; line-height:2;" % (colors[3])
-      elif percent <= 50:
-        tagcloud[tag] = "font-size:1.7em; color:%s; margin:0.1em 0.3em; line-height:2;" % (colors[4])
-      elif percent <= 60:
-        tagcloud[tag] = "font-size:1.9em; font-weight:bold; color:%s; margin:0.1em 0.3em; line-height:2;" % (colors[5])
-      elif percent <= 70:
-        tagcloud[tag] = "font-size:2.1em; color:%s; margin:0.1em 0.3em; line-height:2;" % (colors[6])
-      elif percent <= 80:
-        tagcloud[tag] = "font-size:2.3em; font-weight:bold; color:%s; margin:0.1em 0.3em; line-height:2;" % (colors[7])
-      elif percent <= 90:
-        tagcloud[tag] = "font-size:2.5em; color:%s; margin:0.1em 0.3em; line-height:2;" % (colors[8])
-      elif percent <= 100:
-        tagcloud[tag] = "font-size:2.7em; font-weight:bold; color:%s; margin:0.1em 0.3em; line-height:2;" % (colors[0])
-
-    keys = list(tagcloud.keys())
-    random.shuffle(keys)
-    tagcloud = {key: tagcloud[key] for key in keys}
-
-    return tagcloud
-
-  def parse(self, lines):
+      percent = (len(self.datadict["tags"][tag])*100/maxtagcount)
+      tier = [idx for idx in range(len(self.cloudtiers)) if percent <= (idx+1)*100/len(self.cloudtiers)][0]
+      color = colors[tier % len(colors)]
+      size, bold = self.cloudtiers[tier]
+      tagcloud[tag] = "font-size:%s;%s color:%s; margin:0.1em 0.3em; line-height:2;" % (size, " font-weight:bold;" if bold else "", self.cloudcolors[color])
+
+    keys = sorted(tagcloud.keys())
+    rng.shuffle(keys)
+    return {key: tagcloud[key] for key in keys}
+
+  def presentation_css(self):
+    """the sparkline and reading bar styles pages would otherwise repeat inline on every element"""
+    rules = [".kr{color:var(--muted);font-family:monospace}"]
+    rules += [".ks%d{color:%s}" % (idx, color) for idx, color in enumerate(self.sparkcolors)]
+    return "%s\n" % ("\n".join(rules))
+
+  def link_stylesheet(self, html):
+    # only pages that use one of presentation_css's classes get the stylesheet
+    if self.stylesheet in html or "</head>" not in html or not re.search(r'class="k[rs]\d*"', html):
+      return html
+    return html.replace("</head>", '<link rel="stylesheet" href="%s"></head>' % (self.stylesheet), 1)
+
+  def parse(self, lines, render=True):
     date, summary, tags, status, content = None, None, None, None, None
     for idx, line in enumerate(lines):
       if line.startswith("date:"):
@@ -210,7 +712,7 @@ class Kalpi:
       if line.startswith("status:"):
         status = line.split(":")[1].strip()
       if line == "\n":
-        content = self.md2html("".join(lines[idx+1:]))
+        content = self.md2html_cached("".join(lines[idx+1:])) if render else None
         break
     return date, summary, tags, status, content
 
@@ -220,12 +722,16 @@ class Kalpi:
     max_minutes = 30
     filled = min(maxsize, int((minutes / max_minutes) * maxsize))
     bar = "█" * filled + "░" * (maxsize - filled)
-    return '<span style="color:var(--muted); font-family:monospace;" title="%d min read">%s</span>' % (minutes, bar)
+    if self.inlinestyles:
+      return '<span style="color:var(--muted); font-family:monospace;" title="%d min read">%s</span>' % (minutes, bar)
+    return '<span class="kr" title="%d min read">%s</span>' % (minutes, bar)
 
   def sparkify(self, content, maxsize=10, unique=True, sparkmode=True):
     sparkid = hashlib.sha256(content.encode("utf-8")).hexdigest()
     spark = "".join(sparkline.sparkify([int(x, base=16) for x in sparkid]))
-    colors = ["#007bff", "#00bcd4", "#17a2b8", "#20c997", "#2196f3", "#28a745", "#4caf50", "#6610f2", "#6c757d", "#6f42c1", "#8357ff", "#dc3545", "#e83e8c", "#f44336", "#fd7e14", "#ffc107", "#20b2aa", "#99cc99", "#0c9", "#5b92e5", "#ffcc66", "#00b7eb", "#69359c", "#fe4164", "#a50b5e"]
+    rng = self.presentation_random(sparkid)
+    colors = range(len(self.sparkcolors))
+    glyph = lambda color, ch: '<span style="color:%s;">%s</span>' % (self.sparkcolors[color], ch) if self.inlinestyles else '<span class="ks%d">%s</span>' % (color, ch)
     charmap = {
       "▁": "◐",
       "▂": "■",
@@ -237,123 +743,136 @@ class Kalpi:
       "█": "▲",
     }
     if unique:
-      sparkcolored = "".join(['<span style="color:%s;">%s</span>' % (random.choice(colors), ch if sparkmode else charmap[ch]) for ch in spark[:maxsize]])
-      sparkcoloredlong = "".join(['<span style="color:%s;">%s</span>' % (random.choice(colors), ch if sparkmode else charmap[ch]) for ch in spark])
+      sparkcolored = "".join([glyph(rng.choice(colors), ch if sparkmode else charmap[ch]) for ch in spark[:maxsize]])
+      sparkcoloredlong = "".join([glyph(rng.choice(colors), ch if sparkmode else charmap[ch]) for ch in spark])
     else:
       chars = ["▣", "►", "◐", "◧", "▤", "▼", "◑", "◨", "▥", "◀", "◒", "◩", "▦", "◆", "◕", "◪", "▧", "◈", "◢", "■", "▨", "◉", "◣", "▩", "◎", "◤", "▲", "●", "◥"]
-      sparkcolored = "".join(['<span style="color:%s;">%s</span>' % (random.choice(colors), random.choice(chars)) for _ in range(len(sparkid[:maxsize]))])
-      sparkcoloredlong = "".join(['<span style="color:%s;">%s</span>' % (random.choice(colors), random.choice(chars)) for _ in range(len(sparkid))])
+      sparkcolored = "".join([glyph(rng.choice(colors), rng.choice(chars)) for _ in range(len(sparkid[:maxsize]))])
+      sparkcoloredlong = "".join([glyph(rng.choice(colors), rng.choice(chars)) for _ in range(len(sparkid))])
     return ('<span class="sparklines" title="%s">%s</span>' % (sparkid, sparkcolored), '<span class="sparklines" title="%s">%s</span>' % (sparkid, sparkcoloredlong))
 
+  def load_body(self, path, render=True):
+    """(markdown lines, rendered html or None) of a post file, what Post.contentmd and Post.content load on access"""
+    with open(path, "r") as f:
+      f.readline()
+      contentmd = self.preprocess_text(f.readlines())
+    return contentmd, self.parse(contentmd, render=render)[4]
+
+  def post_body(self, digest, contentmd):
+    """(sparkline, long sparkline, word count, code block count) of a post body, kept per digest in the manifest so unchanged posts skip them"""
+    key = self.body_key(digest)
+    if key not in self.manifest["bodies"]:
+      sparkcolored, sparkcoloredlong = self.sparkify("\n".join(contentmd))
+      # word count leaves out code blocks
+      content_text = "".join(contentmd)
+      text_without_code = re.sub(r'```.*?```', '', content_text, flags=re.DOTALL)
+      self.manifest["bodies"][key] = [sparkcolored, sparkcoloredlong, len(text_without_code.split()), content_text.count("```") // 2]
+    self.usedbodies.add(key)
+    return self.manifest["bodies"][key]
+
+  def body_key(self, digest):
+    return self.digest([digest, self.seed, self.inlinestyles])
+
+  def load_post(self, path, name, include_drafts=False):
+    """parse a post file's metadata, returns None for drafts unless include_drafts"""
+    with open(path, "r") as f:
+      # front matter ends at the first empty line, drafts are skipped before the body is read
+      title = f.readline()[:-1].strip("\n..").rstrip(":")
+      header = []
+      for line in f:
+        header.append(line)
+        if line == "\n":
+          break
+      date, summary, tags, status, content = self.parse(header, render=False)
+      is_draft = status != "public"
+      if not include_drafts and is_draft:
+        return None
+      contentmd = self.preprocess_text(header + f.readlines())
+      year, month, day = date[:3]
+      pretty_date = time.strftime(self.postdateformat, date)
+      epoch = time.mktime(date)
+      url = "/posts/%d%02d%02d_%s.html" % (year, month, day, os.path.splitext(name)[0])
+      digest = self.digest([title, contentmd])
+      sparkcolored, sparkcoloredlong, word_count, code_blocks = self.post_body(digest, contentmd)
+      reading_time = max(1, int(word_count / 200))
+      reading_bar = self.reading_time_bar(reading_time)
+
+      # RFC 822 date format for RSS
+      rss_date = time.strftime("%a, %d %b %Y %H:%M:%S +0000", date)
+
+      post = Post(**{
+        "path": path,
+        "loader": self.load_body,
+        "digest": digest,
+        "title": title,
+        "epoch": epoch,
+        "url": url,
+        "pretty_date": pretty_date,
+        "sdate": time.strftime(self.stimeformat, date),
+        "date": date,
+        "year": year,
+        "month": month,
+        "day": day,
+        "tags": tags,
+        "summary": summary,
+        "filename": name,
+        "sparkline": sparkcolored,
+        "sparklinelong": sparkcoloredlong,
+        "reading_time": reading_time,
+        "reading_bar": reading_bar,
+        "word_count": word_count,
+        "code_blocks": code_blocks,
+        "rss_date": rss_date,
+        "previous": None,
+        "next": None,
+        "is_draft": is_draft,
+      })
+      return post
+
   def get_tree(self, source, include_drafts=False):
+    """parse posts under source into self.store, make starts each build with an empty store"""
     posts = []
-    self.datadict["tags"] = dict()
     for root, ds, fs in os.walk(source):
-      for name in fs:
+      # directory listing order would otherwise leak into tag order
+      ds.sort()
+      for name in sorted(fs):
         if name[0] == ".": continue
         if not re.match(r"^.+\.(md|mdown|markdown)$", name): continue
         path = os.path.join(root, name)
-        with open(path, "r") as f:
-          title = f.readline()[:-1].strip("\n..").rstrip(":")
-          contentmd = self.preprocess_text(f.readlines())
-          date, summary, tags, status, content = self.parse(contentmd)
-          is_draft = status != "public"
-          if not include_drafts and is_draft:
-            continue
-          year, month, day = date[:3]
-          pretty_date = time.strftime(self.postdateformat, date)
-          epoch = time.mktime(date)
-          url = "/posts/%d%02d%02d_%s.html" % (year, month, day, os.path.splitext(name)[0])
-          sparkcolored, sparkcoloredlong = self.sparkify("\n".join(contentmd))
-
-          # calculate word count and reading time early
-          content_text = "".join(contentmd)
-          code_blocks_count = len(re.findall(r'```', content_text)) // 2
-          text_without_code = re.sub(r'```.*?```', '', content_text, flags=re.DOTALL)
-          word_count = len(text_without_code.split())
-          reading_time = max(1, int(word_count / 200))
-          reading_bar = self.reading_time_bar(reading_time)
-
-          # RFC 822 date format for RSS
-          rss_date = time.strftime("%a, %d %b %Y %H:%M:%S +0000", date)
-
-          post = {
-            "title": title,
-            "epoch": epoch,
-            "content": content,
-            "contentmd": contentmd,
-            "url": url,
-            "pretty_date": pretty_date,
-            "sdate": time.strftime(self.stimeformat, date),
-            "date": date,
-            "year": year,
-            "month": month,
-            "day": day,
-            "tags": tags,
-            "summary": summary,
-            "filename": name,
-            "sparkline": sparkcolored,
-            "sparklinelong": sparkcoloredlong,
-            "reading_time": reading_time,
-            "reading_bar": reading_bar,
-            "word_count": word_count,
-            "rss_date": rss_date,
-            "previous": None,
-            "next": None,
-            "is_draft": is_draft,
-          }
-          posts.append(post)
-          for tag in tags:
-            if tag not in self.datadict["tags"].keys():
-              self.datadict["tags"][tag] = [{
-                "title": title,
-                "tags": tags,
-                "sparkline": sparkcolored,
-                "sparklinelong": sparkcoloredlong,
-                "summary": summary,
-                "url": url,
-                "pretty_date": pretty_date,
-                "year": year,
-                "month": month,
-                "day": day,
-              }]
-            else:
-              self.datadict["tags"][tag].append({
-                "title": title,
-                "tags": tags,
-                "sparkline": sparkcolored,
-                "sparklinelong": sparkcoloredlong,
-                "summary": summary,
-                "url": url,
-                "pretty_date": pretty_date,
-                "year": year,
-                "month": month,
-                "day": day,
-              })
+        # unchanged files keep their parsed post between builds of a long running process
+        stat = os.stat(path)
+        key = (path, include_drafts)
+        self.seentree.add(key)
+        if key not in self.treecache or self.treecache[key][0] != (stat.st_mtime_ns, stat.st_size):
+          self.treecache[key] = ((stat.st_mtime_ns, stat.st_size), self.load_post(path, name, include_drafts=include_drafts))
+        post = self.treecache[key][1]
+        if not post:
+          continue
+        self.usedbodies.add(self.body_key(post.digest))
+        posts.append(self.store.add(post))
+    # templates get per tag views over the store rather than copies of every post
+    self.datadict["tags"] = self.store.tagviews()
     return posts
 
+  def prune_tree(self):
+    """drop cached posts and bodies of files this build's scans no longer reached"""
+    self.treecache = {key: self.treecache[key] for key in self.treecache if key in self.seentree}
+    self.manifest["bodies"] = {key: self.manifest["bodies"][key] for key in self.usedbodies if key in self.manifest["bodies"]}
+    self.seentree, self.usedbodies = set(), set()
+
   def gen_activity_heatmap(self, stats):
     """Generate activity heat map using Unicode blocks"""
-    # get all dates
-    post_dates = {}
-    for date_str in stats["dates"]:
-      post_dates[date_str] = post_dates.get(date_str, 0) + 1
-
-    # group by year-month
-    months = {}
-    for date_str in stats["dates"]:
-      ym = date_str[:6]  # YYYYMM
-      months[ym] = months.get(ym, 0) + 1
+    months = stats["groups"]["per_yyyymm"]
 
     # create heat map
     heatmap = []
-    years = sorted(set(d[:4] for d in stats["dates"]))
+    years = sorted(stats["groups"]["per_yyyy"])
 
     for year in years:
       year_line = year + " "
       for month in range(1, 13):
         ym = "%s%02d" % (year, month)
-        count = months.get(ym, 0)
+        count = months[ym]["posts"] if ym in months else 0
         if count == 0:
           char = "░"
         elif count == 1:
@@ -382,100 +901,9 @@ class Kalpi:
     return "\n".join(bars)
 
   def gen_stats(self):
-    stats = {}
-    stats["count_posts"] = len(self.datadict["posts"])
-    stats["count_tags"] = len(self.datadict["tags"])
-    stats["groups"] = {
-      "per_yyyymm": {},
-      "per_yyyy": {},
-      "per_tag": {},
-    }
-    stats["duration"] = {
-      "start_year": 2100,
-      "end_year": 2000,
-    }
-    stats["dates"] = []
-    stats["word_counts"] = []
-    stats["code_blocks"] = []
-    stats["post_details"] = []
-
-    for post in self.datadict["posts"]:
-      if post["year"] < stats["duration"]["start_year"]:
-        stats["duration"]["start_year"] = post["year"]
-      if post["year"] > stats["duration"]["end_year"]:
-        stats["duration"]["end_year"] = post["year"]
-
-      stats["dates"].append("%04d%02d%02d" % (post["year"], post["month"], post["day"]))
-
-      # calculate word count (excluding code blocks)
-      content_text = "".join(post["contentmd"])
-      code_blocks = len(re.findall(r'```', content_text)) // 2
-      text_without_code = re.sub(r'```.*?```', '', content_text, flags=re.DOTALL)
-      word_count = len(text_without_code.split())
-
-      # calculate reading time (avg 200 words per minute)
-      reading_time = max(1, int(word_count / 200))
-
-      stats["word_counts"].append(word_count)
-      stats["code_blocks"].append(code_blocks)
-      stats["post_details"].append({
-        "title": post["title"],
-        "url": post["url"],
-        "words": word_count,
-        "code_blocks": code_blocks,
-        "tags_count": len(post["tags"]),
-        "date": "%04d-%02d-%02d" % (post["year"], post["month"], post["day"]),
-        "reading_time": reading_time
-      })
-
-      # add reading time to post
-      post["reading_time"] = reading_time
-      post["word_count"] = word_count
-
-      key = "%04d%02d" % (post["year"], post["month"])
-      if key not in stats["groups"]["per_yyyymm"]:
-        stats["groups"]["per_yyyymm"][key] = {
-          "posts": 1,
-          "tagslist": [],
-          "tags": len(post["tags"]),
-        }
-      else:
-        stats["groups"]["per_yyyymm"][key]
-        stats["groups"]["per_yyyymm"][key]["posts"] += 1
-        stats["groups"]["per_yyyymm"][key]["tags"] += len(post["tags"])
-        stats["groups"]["per_yyyymm"][key]["tagslist"] += post["tags"]
-        stats["groups"]["per_yyyymm"][key]["tagslist"] = list(set(stats["groups"]["per_yyyymm"][key]["tagslist"]))
-
-      key = "%04d" % (post["year"])
-      if key not in stats["groups"]["per_yyyy"]:
-        stats["groups"]["per_yyyy"][key] = {
-          "posts": 1,
-          "tagslist": [],
-          "tags": len(post["tags"]),
-        }
-      else:
-        stats["groups"]["per_yyyy"][key]
-        stats["groups"]["per_yyyy"][key]["posts"] += 1
-        stats["groups"]["per_yyyy"][key]["tags"] += len(post["tags"])
-        stats["groups"]["per_yyyy"][key]["tagslist"] += post["tags"]
-        stats["groups"]["per_yyyy"][key]["tagslist"] = list(set(stats["groups"]["per_yyyy"][key]["tagslist"]))
-
-      for tag in post["tags"]:
-        if tag not in stats["groups"]["per_tag"]:
-          stats["groups"]["per_tag"][tag] = {
-            "posts": 1,
-          }
-        else:
-          stats["groups"]["per_tag"][tag]["posts"] += 1
-
-    stats["most_used_tag"] = max(stats["groups"]["per_tag"].keys(), key=(lambda key: stats["groups"]["per_tag"][key]["posts"]))
-    stats["least_used_tag"] = min(stats["groups"]["per_tag"].keys(), key=(lambda key: stats["groups"]["per_tag"][key]["posts"]))
-
-    stats["max_posts_yyyy"] = max(stats["groups"]["per_yyyy"].keys(), key=(lambda key: stats["groups"]["per_yyyy"][key]["posts"]))
-    stats["min_posts_yyyy"] = min(stats["groups"]["per_yyyy"].keys(), key=(lambda key: stats["groups"]["per_yyyy"][key]["posts"]))
-
-    stats["max_tags_yyyy"] = max(stats["groups"]["per_yyyy"].keys(), key=(lambda key: len(stats["groups"]["per_yyyy"][key]["tagslist"])))
-    stats["min_tags_yyyy"] = min(stats["groups"]["per_yyyy"].keys(), key=(lambda key: len(stats["groups"]["per_yyyy"][key]["tagslist"])))
+    # per post metrics were gathered at load time, only posts added, removed or changed since the last build touch the columns
+    self.poststats.sync(self.datadict["posts"])
+    stats = self.poststats.summary()
 
     curdate = datetime.now()
     maxdate = datetime.strptime(max(stats["dates"]), "%Y%m%d")
@@ -484,73 +912,271 @@ class Kalpi:
     rd2 = dateutil.relativedelta.relativedelta (curdate, maxdate)
     rd3 = dateutil.relativedelta.relativedelta (curdate, mindate)
 
-    # word count statistics
-    total_words = sum(stats["word_counts"])
-    avg_words = int(total_words / len(stats["word_counts"])) if stats["word_counts"] else 0
-    min_words = min(stats["word_counts"]) if stats["word_counts"] else 0
-    max_words = max(stats["word_counts"]) if stats["word_counts"] else 0
-    total_code_blocks = sum(stats["code_blocks"])
-
-    # find longest and shortest posts
-    longest_post = max(stats["post_details"], key=lambda x: x["words"])
-    shortest_post = min(stats["post_details"], key=lambda x: x["words"])
-
-    # store simplified stats for template
     stats["writing_period"] = "%dy%dm%dd" % (rd1.years, rd1.months, rd1.days)
     stats["first_post_date"] = datetime.strftime(mindate, "%d/%b/%Y")
     stats["last_post_date"] = datetime.strftime(maxdate, "%d/%b/%Y")
     stats["days_since_last"] = (curdate - maxdate).days
-    stats["avg_posts_per_year"] = int(sum([stats["groups"]["per_yyyy"][x]["posts"] for x in stats["groups"]["per_yyyy"]])/len(stats["groups"]["per_yyyy"].keys()))
-    stats["avg_posts_per_tag"] = int(sum([stats["groups"]["per_tag"][x]["posts"] for x in stats["groups"]["per_tag"]])/len(stats["groups"]["per_tag"].keys()))
 
     # generate visualizations
     stats["activity_heatmap"] = self.gen_activity_heatmap(stats)
     stats["tag_distribution"] = self.gen_tag_distribution(stats)
 
-    # generate content metrics
-    stats["content_metrics"] = {
-      "total_words": total_words,
-      "avg_words": avg_words,
-      "min_words": min_words,
-      "max_words": max_words,
-      "total_code_blocks": total_code_blocks,
-      "longest_post": longest_post,
-      "shortest_post": shortest_post,
-      "top_10_longest": sorted(stats["post_details"], key=lambda x: x["words"], reverse=True)[:10],
-      "top_10_shortest": sorted(stats["post_details"], key=lambda x: x["words"])[:10],
-    }
+    if self.memory is not None:
+      # --serve leaves the published charts alone
+      return stats
 
     ppt = {tag:stats["groups"]["per_tag"][tag]["posts"] for tag in stats["groups"]["per_tag"]}
-    utils.to_xkcd(ppt, "%s/posts_per_tag.png" % (self.statsdir), "")
+    self.render_chart(ppt, "%s/posts_per_tag.png" % (self.statsdir), "")
 
     ppy = {yyyy:stats["groups"]["per_yyyy"][yyyy]["posts"] for yyyy in stats["groups"]["per_yyyy"]}
-    utils.to_xkcd(ppy, "%s/posts_per_year.png" % (self.statsdir), "")
+    self.render_chart(ppy, "%s/posts_per_year.png" % (self.statsdir), "")
 
     tpy = {yyyy:len(stats["groups"]["per_yyyy"][yyyy]["tagslist"]) for yyyy in stats["groups"]["per_yyyy"]}
-    utils.to_xkcd(tpy, "%s/tags_per_year.png" % (self.statsdir), "")
+    self.render_chart(tpy, "%s/tags_per_year.png" % (self.statsdir), "")
 
     return stats
 
-  def fetch_github_stats(self, username):
+  def tag_url(self, tag):
+    # characters unsafe in urls or filenames become ~xx per utf-8 byte, ~ itself included so distinct tags keep distinct pages
+    safe = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.-"
+    return "/tags/%s.html" % ("".join([ch if ch in safe else "".join(["~%02x" % (x) for x in ch.encode("utf-8")]) for ch in tag]))
+
+  def paginate(self, ids):
+    """split newest first ids into pages anchored at the oldest post, so older pages keep their members as posts are added"""
+    # the first page takes the partial newest chunk on top of a full one, no page count so older pages stay put
+    oldest = ids[::-1]
+    chunks = [oldest[idx:idx+self.pagesize] for idx in range(0, len(oldest), self.pagesize)]
+    if len(chunks) > 1 and len(chunks[-1]) < self.pagesize:
+      chunks[-2:] = [chunks[-2] + chunks[-1]]
+    return [chunk[::-1] for chunk in chunks]
+
+  def listings(self):
+    """paginated archive, per tag and per year pages as {filename: (templatefile, spec)}, empty unless pagesize is set"""
+    # specs hold store ids rather than posts so tasks stay small, listing_datadict resolves them
+    listings = {}
+    if not self.pagesize:
+      return listings
+    ids = [post.id for post in self.datadict["posts"]]
+    pages = self.paginate(ids)
+    urls = ["/archive/page/%d.html" % (idx+1) for idx in range(len(pages)-1)] + ["/archive.html"]
+    for idx, chunk in enumerate(pages):
+      listings["%s%s" % (self.outputdir, urls[idx])] = ("archive.html", {"posts": chunk, "pagination": {
+        "page": idx+1,
+        "newer": urls[idx+1] if idx+1 < len(pages) else None,
+        "older": urls[idx-1] if idx else None,
+      }})
+
+    # tags.html keeps an anchor per tag with its newest posts, every tag gets a page of its own
+    epochs = {post.id: post.epoch for post in self.datadict["posts"]}
+    tags = {tag: sorted(self.datadict["tags"][tag].ids, key=lambda x: epochs.get(x, 0), reverse=True) for tag in self.datadict["tags"]}
+    listings[self.templatemapping["tags.html"]] = ("tags.html", {"tags": {tag: tags[tag][:self.pagesize] for tag in tags}, "pagination": {"page": 1, "newer": None, "older": None}})
+    for tag in tags:
+      listings["%s%s" % (self.outputdir, self.tag_url(tag))] = ("tags.html", {"tags": {tag: tags[tag]}, "pagination": {"page": 1, "newer": None, "older": None, "tag": tag}})
+
+    for yyyy in self.datadict["stats"]["groups"]["per_yyyy"]:
+      listings["%s/archive/%s.html" % (self.outputdir, yyyy)] = ("archive.html", {"posts": [post.id for post in self.datadict["posts"] if "%04d" % (post.year) == yyyy], "pagination": {"page": 1, "newer": None, "older": None, "year": yyyy}})
+    return listings
+
+  def listing_datadict(self, spec):
+    datadict = dict(self.datadict)
+    datadict["pagination"] = spec["pagination"]
+    if "posts" in spec:
+      datadict["posts"] = [self.store.posts[x] for x in spec["posts"]]
+    if "tags" in spec:
+      datadict["tags"] = {tag: TagView(self.store, spec["tags"][tag]) for tag in spec["tags"]}
+    return datadict
+
+  def listing_inputs(self, spec, keys):
+    # members carry what their rows render, other keys the template reads count as usual
+    members = lambda ids: [self.store.posts[x].member() for x in ids]
+    return self.digest({
+      "data": self.data_digest([x for x in (self.datadict if keys is None else keys) if x not in ["posts", "tags", "pagination"]]),
+      "pagination": spec["pagination"],
+      "seed": self.seed,
+      "posts": members(spec.get("posts", [])),
+      "tags": {tag: members(spec["tags"][tag]) for tag in spec.get("tags", {})},
+    })
+
+  def search_terms(self, post):
+    """term -> token positions over a post's title and markdown body"""
+    contentmd = post["contentmd"]
+    body = contentmd[contentmd.index("\n")+1:] if "\n" in contentmd else contentmd
+    terms = collections.defaultdict(list)
+    for pos, term in enumerate(re.findall(r"[a-z0-9]+", " ".join([post["title"]] + body).lower())):
+      terms[term].append(pos)
+    return {term: terms[term] for term in terms if len(term) > 1}
+
+  def build_search(self, prefixlen=2):
+    """write a search index sharded by term prefix under static/search, returns (written, unchanged) shard counts"""
+    # docs.json maps stable ids to [url, title, date, summary], terms_<prefix>.json maps terms to [[id, position, ...], ...]
+    posts = self.datadict["posts"]
+    ids = self.manifest["searchids"]
+    nextid = max(ids.values(), default=-1) + 1
+    for post in posts:
+      if post["url"] not in ids:
+        ids[post["url"]], nextid = nextid, nextid + 1
+    current = {post["url"] for post in posts}
+    for url in [x for x in ids if x not in current]:
+      del ids[url]
+
+    docs = {
+      "prefix": prefixlen,
+      "docs": {ids[post["url"]]: [post["url"], post["title"], post["pretty_date"], post["summary"]] for post in posts},
+    }
+    shards = {}
+    # post digests cover title, date and summary too, nothing to do when no post was added, edited or removed
+    state = self.digest([[ids[post["url"]], post["digest"]] for post in posts])
+    docsfile = "%s/docs.json" % (self.searchdir)
+    if self.manifest.get("searchstate") == state and self.is_fresh("search", docsfile, self.manifest["search"].get(docsfile, "")):
+      return 0, len(self.manifest["search"])
+    # postings per source digest, only new or edited posts are tokenized
+    if self.searchterms is None:
+      self.searchterms = utils.load_json(self.searchfile) if self.memory is None and not self.rebuild and os.path.isfile(self.searchfile) else {}
+    cached = set(self.searchterms)
+    self.searchterms = {post["digest"]: self.searchterms[post["digest"]] if post["digest"] in self.searchterms else self.search_terms(post) for post in posts}
+    if self.memory is None and cached != set(self.searchterms):
+      utils.file_save(self.searchfile, json.dumps(self.searchterms, separators=(",", ":")))
+    for post in sorted(posts, key=lambda x: ids[x["url"]]):
+      for term, positions in self.searchterms[post["digest"]].items():
+        prefix = re.sub(r"[^a-z0-9]", "_", term[:prefixlen])
+        shards.setdefault(prefix, {}).setdefault(term, []).append([ids[post["url"]]] + positions)
+    docs["shards"] = sorted(shards)
+
+    written, unchanged = 0, 0
+    outputs = {docsfile: docs}
+    for prefix in shards:
+      outputs["%s/terms_%s.json" % (self.searchdir, prefix)] = shards[prefix]
+    for filename in outputs:
+      # shards are serialized once, the text doubles as the manifest input
+      text = json.dumps(outputs[filename], separators=(",", ":"), sort_keys=True)
+      inputs = hashlib.sha256(text.encode("utf-8")).hexdigest()
+      if self.is_fresh("search", filename, inputs):
+        unchanged += 1
+        continue
+      self.save_output(filename, text)
+      self.manifest["search"][filename] = inputs
+      written += 1
+    for filename in [x for x in self.manifest["search"] if x not in outputs]:
+      # prefixes no post uses anymore
+      del self.manifest["search"][filename]
+      if self.memory is not None:
+        self.memory.pop(filename, None)
+      elif os.path.isfile(filename):
+        os.remove(filename)
+        try:
+          os.removedirs(os.path.dirname(filename))
+        except OSError:
+          pass
+    self.manifest["searchstate"] = state
+    return written, unchanged
+
+  def render_chart(self, plotdict, filename, title, rotate=True, trimlength=20):
+    """queue a utils.to_xkcd chart on a worker process unless its data and style match the last render"""
+    inputs = self.digest([plotdict, title, rotate, trimlength, "xkcd", 300])
+    if self.is_fresh("charts", filename, inputs):
+      self.unchanged += 1
+      return
+    if not self.chartpool:
+      self.chartpool = concurrent.futures.ProcessPoolExecutor(max_workers=3, initializer=init_worker)
+    self.chartjobs[filename] = (inputs, self.chartpool.submit(utils.to_xkcd, plotdict, filename, title, rotate=rotate, trimlength=trimlength))
+
+  def join_charts(self):
+    """wait for queued charts, only those that rendered are recorded in the manifest"""
+    for filename in self.chartjobs:
+      inputs, future = self.chartjobs[filename]
+      try:
+        future.result()
+        self.manifest["charts"][filename] = inputs
+        self.rendered += 1
+      except Exception as ex:
+        utils.warn("could not render %s: %s" % (filename, ex))
+    if self.chartpool:
+      self.chartpool.shutdown()
+    self.chartpool, self.chartjobs = None, {}
+
+  def post_images(self, post):
+    # kept per digest in the manifest so warm builds find images without reading bodies
+    if post["digest"] not in self.manifest["images"]:
+      self.manifest["images"][post["digest"]] = re.findall(r'<img\s[^>]*?src="(/static/[^"]+\.(?:png|jpe?g))"', post["content"] or "", flags=re.IGNORECASE)
+    return self.manifest["images"][post["digest"]]
+
+  def build_assets(self, urls):
+    """resize the local images at urls into content hashed webp variants and a jpeg fallback, on worker processes with --jobs"""
+    # sources are re-read only when mtime or size change, and resized only when their digest has no variants yet
+    self.assets = {}
+    settings = [self.imagewidths, self.imagequality]
+    exists = lambda asset: all([os.path.isfile("%s%s" % (self.outputdir, x)) for x in [x[1] for x in asset["srcset"]] + [asset["src"]]])
+    jobs, processed = {}, 0
+    for url in sorted(set(urls)):
+      filename = "%s%s" % (self.outputdir, url)
+      if not os.path.isfile(filename):
+        continue
+      stat = os.stat(filename)
+      entry = self.manifest["assets"].get(url)
+      if not self.rebuild and entry and entry["stat"] == [stat.st_mtime_ns, stat.st_size] and entry["settings"] == settings and exists(entry["asset"]):
+        self.assets[url] = entry["asset"]
+        continue
+      with open(filename, "rb") as fp:
+        digest = hashlib.sha256(fp.read() + json.dumps(settings).encode("utf-8")).hexdigest()[:12]
+      jobs[url] = (filename, "%s.%s" % (os.path.splitext(filename)[0], digest), [stat.st_mtime_ns, stat.st_size])
+
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs, initializer=init_worker) if self.jobs > 1 and len(jobs) > 1 else None
+    futures = {url: pool.submit(utils.to_image_variants, jobs[url][0], jobs[url][1], self.imagewidths, self.imagequality) for url in jobs} if pool else {}
+    for url in jobs:
+      try:
+        variants, fallback = futures[url].result() if pool else utils.to_image_variants(jobs[url][0], jobs[url][1], self.imagewidths, self.imagequality)
+      except Exception as ex:
+        utils.warn("could not resize %s: %s" % (url, ex))
+        continue
+      asset = {"srcset": [[x[0], x[1].replace(self.outputdir, "")] for x in variants], "src": fallback.replace(self.outputdir, "") if fallback else url}
+      # variants of an earlier version of the source go away with it
+      entry = self.manifest["assets"].get(url)
+      if entry:
+        for stale in set([x[1] for x in entry["asset"]["srcset"]] + [entry["asset"]["src"]]) - set([x[1] for x in asset["srcset"]] + [asset["src"], url]):
+          if os.path.isfile("%s%s" % (self.outputdir, stale)):
+            os.remove("%s%s" % (self.outputdir, stale))
+      self.manifest["assets"][url] = {"stat": jobs[url][2], "settings": settings, "asset": asset}
+      self.assets[url] = asset
+      processed += 1
+    if pool:
+      pool.shutdown()
+    return processed, len(self.assets) - processed
+
+  def image_srcset(self, match):
+    """point a local post image at its largest variant and list every variant in srcset"""
+    tag = match.group(0)
+    src = re.search(r'\ssrc="([^"]+)"', tag)
+    if not src or src.group(1) not in self.assets or " srcset=" in tag:
+      return tag
+    asset = self.assets[src.group(1)]
+    largest = asset["srcset"][-1][0]
+    return tag.replace(src.group(0), ' src="%s" srcset="%s" sizes="(max-width: %dpx) 100vw, %dpx"' % (asset["src"], ", ".join(["%s %dw" % (x[1], x[0]) for x in asset["srcset"]]), largest, largest), 1)
+
+  def fetch_github_stats(self, username, deadline=None):
     """Fetch GitHub statistics using the API"""
     stats = {}
     github_token = os.environ.get("GITHUB_TOKEN") or os.environ.get("GITHUB_API_KEY")
+    deadline = deadline or time.monotonic() + self.fetch_timeout
 
     # 1. Fetch rank from github-readme-stats
-    try:
-      readme_url = f"https://github-readme-stats.vercel.app/api?username={username}"
-      response = requests.get(readme_url, timeout=10)
-      if response.status_code == 200:
-        # Parse SVG to extract rank
-        import re
-        rank_match = re.search(r'Rank:\s*([A-Z][+-]?)', response.text)
-        if rank_match:
-          stats["rank"] = f"{rank_match.group(1)} (top 25%)"
-    except Exception as e:
-      utils.warn(f"Could not fetch GitHub rank: {e}")
+    def fetch_rank():
+      try:
+        readme_url = f"https://github-readme-stats.vercel.app/api?username={username}"
+        response = utils.http_get(readme_url, timeout=10)
+        if response.status_code == 200:
+          # Parse SVG to extract rank
+          rank_match = re.search(r'Rank:\s*([A-Z][+-]?)', response.text)
+          if rank_match:
+            stats["rank"] = f"{rank_match.group(1)} (top 25%)"
+          # Fallback: Use github-readme-stats for last year only
+          commits_match = re.search(r'Total Commits[^:]*:\s*([0-9.]+[kM]?)', response.text)
+          if not github_token and commits_match:
+            stats["total_commits"] = f"{commits_match.group(1)} (last year)"
+      except Exception as e:
+        utils.warn(f"Could not fetch GitHub rank: {e}")
 
-    # 2. Fetch all-time commits via GraphQL API (requires token)
-    if github_token:
+    # 2. Fetch all-time commits, followers, PRs, stars and languages in one aliased GraphQL query (requires token)
+    def fetch_graphql():
       try:
         graphql_url = "https://api.github.com/graphql"
         headers = {
@@ -558,156 +1184,174 @@ class Kalpi:
           "Content-Type": "application/json"
         }
 
-        # Get current year to query contribution calendar
+        # Query contribution calendars for the last 10 years, one alias per year
         current_year = datetime.now().year
-
-        # Query for contributions over multiple years (go back 10 years)
-        total_contributions = 0
-        for year in range(current_year - 9, current_year + 1):
-          query = """
-          query($username: String!, $from: DateTime!, $to: DateTime!) {
-            user(login: $username) {
-              contributionsCollection(from: $from, to: $to) {
-                contributionCalendar {
-                  totalContributions
-                }
-              }
+        years = list(range(current_year - 9, current_year + 1))
+        contributions = "\n".join(['y%d: contributionsCollection(from: "%d-01-01T00:00:00Z", to: "%d-12-31T23:59:59Z") { contributionCalendar { totalContributions } }' % (year, year, year) for year in years])
+        query = """
+        query($username: String!) {
+          user(login: $username) {
+            %s
+            followers { totalCount }
+            pullRequests { totalCount }
+            starred: repositories(first: 100, privacy: PUBLIC, ownerAffiliations: OWNER, orderBy: {field: STARGAZERS, direction: DESC}) {
+              nodes { stargazerCount }
+            }
+            top: repositories(first: 30, privacy: PUBLIC, ownerAffiliations: OWNER, orderBy: {field: STARGAZERS, direction: DESC}) {
+              nodes { languages(first: 100) { edges { size node { name } } } }
             }
           }
-          """
-
-          variables = {
-            "username": username,
-            "from": f"{year}-01-01T00:00:00Z",
-            "to": f"{year}-12-31T23:59:59Z"
-          }
-
-          payload = {"query": query, "variables": variables}
-          response = requests.post(graphql_url, json=payload, headers=headers, timeout=10)
+        }
+        """ % (contributions)
 
-          if response.status_code == 200:
-            data = response.json()
-            if "data" in data and data["data"]["user"]:
-              year_contributions = data["data"]["user"]["contributionsCollection"]["contributionCalendar"]["totalContributions"]
-              total_contributions += year_contributions
+        payload = {"query": query, "variables": {"username": username}}
+        import requests
+        response = requests.post(graphql_url, json=payload, headers=headers, timeout=10)
+        data = response.json() if response.status_code == 200 else {}
+        user = (data.get("data") or {}).get("user")
+        if not user:
+          raise Exception(data.get("errors") or "HTTP %d" % (response.status_code))
 
+        total_contributions = sum([user["y%d" % (year)]["contributionCalendar"]["totalContributions"] for year in years])
         # Format number (e.g., 16400 -> "16.4k")
         if total_contributions >= 1000:
           stats["total_commits"] = f"{total_contributions/1000:.1f}k"
         else:
           stats["total_commits"] = str(total_contributions)
         utils.info(f"Fetched {total_contributions} total commits via GraphQL")
-      except Exception as e:
-        utils.warn(f"Could not fetch commits via GraphQL: {e}")
-    else:
-      # Fallback: Use github-readme-stats for last year only
-      try:
-        readme_url = f"https://github-readme-stats.vercel.app/api?username={username}"
-        response = requests.get(readme_url, timeout=10)
-        if response.status_code == 200:
-          import re
-          commits_match = re.search(r'Total Commits[^:]*:\s*([0-9.]+[kM]?)', response.text)
-          if commits_match:
-            stats["total_commits"] = f"{commits_match.group(1)} (last year)"
-      except Exception as e:
-        utils.warn(f"Could not fetch commits from github-readme-stats: {e}")
-
-    # 2. REST API: Followers
-    try:
-      user_resp = requests.get(f"https://api.github.com/users/{username}", timeout=10)
-      if user_resp.status_code == 200:
-        stats["followers"] = user_resp.json().get("followers", 0)
-    except Exception as e:
-      utils.warn(f"Error fetching followers: {e}")
 
-    # 3. REST API: Total PRs
-    try:
-      pr_resp = requests.get(
-        f"https://api.github.com/search/issues?q=author:{username}+type:pr",
-        timeout=10
-      )
-      if pr_resp.status_code == 200:
-        stats["total_prs"] = pr_resp.json().get("total_count", 0)
-    except Exception as e:
-      utils.warn(f"Error fetching PRs: {e}")
-
-    # 4. REST API: Stars and Languages (aggregate from repos)
-    try:
-      repos_resp = requests.get(
-        f"https://api.github.com/users/{username}/repos?per_page=100&sort=stars",
-        timeout=10
-      )
-      if repos_resp.status_code == 200:
-        repos = repos_resp.json()
-
-        # Total stars
-        stats["total_stars"] = sum(repo.get("stargazers_count", 0) for repo in repos)
+        stats["followers"] = user["followers"]["totalCount"]
+        stats["total_prs"] = user["pullRequests"]["totalCount"]
+        stats["total_stars"] = sum([repo["stargazerCount"] for repo in user["starred"]["nodes"]])
 
-        # Aggregate languages (limit to top 30 repos to reduce API calls)
+        # Top 5 languages by usage across the top 30 repos
         language_bytes = {}
-        for repo in repos[:30]:
-          try:
-            lang_resp = requests.get(repo["languages_url"], timeout=5)
-            if lang_resp.status_code == 200:
-              for lang, bytes_count in lang_resp.json().items():
-                language_bytes[lang] = language_bytes.get(lang, 0) + bytes_count
-          except:
-            continue
-
-        # Top 5 languages by usage
+        for repo in user["top"]["nodes"]:
+          for edge in repo["languages"]["edges"]:
+            language_bytes[edge["node"]["name"]] = language_bytes.get(edge["node"]["name"], 0) + edge["size"]
         if language_bytes:
           top_langs = sorted(language_bytes.items(), key=lambda x: x[1], reverse=True)[:5]
           stats["languages"] = "/".join([lang.lower() for lang, _ in top_langs])
-    except Exception as e:
-      utils.warn(f"Error fetching repos/stars/languages: {e}")
+      except Exception as e:
+        utils.warn(f"Could not fetch stats via GraphQL, falling back to REST: {e}")
+        utils.run_parallel({"followers": fetch_followers, "prs": fetch_prs, "repos": fetch_repos}, timeout=deadline-time.monotonic())
+
+    # 3. REST API: Followers (no token or GraphQL failed)
+    def fetch_followers():
+      try:
+        user_resp = utils.http_get(f"https://api.github.com/users/{username}", timeout=10)
+        if user_resp.status_code == 200:
+          stats["followers"] = user_resp.json().get("followers", 0)
+      except Exception as e:
+        utils.warn(f"Error fetching followers: {e}")
+
+    # 4. REST API: Total PRs
+    def fetch_prs():
+      try:
+        pr_resp = utils.http_get(
+          f"https://api.github.com/search/issues?q=author:{username}+type:pr",
+          timeout=10
+        )
+        if pr_resp.status_code == 200:
+          stats["total_prs"] = pr_resp.json().get("total_count", 0)
+      except Exception as e:
+        utils.warn(f"Error fetching PRs: {e}")
+
+    # 5. REST API: Stars and Languages (aggregate from repos)
+    def fetch_repos():
+      try:
+        repos_resp = utils.http_get(
+          f"https://api.github.com/users/{username}/repos?per_page=100&sort=stars",
+          timeout=10
+        )
+        if repos_resp.status_code == 200:
+          repos = repos_resp.json()
+
+          # Total stars
+          stats["total_stars"] = sum(repo.get("stargazers_count", 0) for repo in repos)
+
+          # Aggregate languages (limit to top 30 repos to reduce API calls)
+          def fetch_languages(url):
+            lang_resp = utils.http_get(url, timeout=5, ttl=86400)
+            return lang_resp.json() if lang_resp.status_code == 200 else {}
+
+          language_bytes = {}
+          languages = utils.run_parallel({repo["languages_url"]: (lambda url=repo["languages_url"]: fetch_languages(url)) for repo in repos[:30]}, timeout=deadline-time.monotonic(), quiet=True)
+          for url in languages:
+            for lang, bytes_count in languages[url].items():
+              language_bytes[lang] = language_bytes.get(lang, 0) + bytes_count
+
+          # Top 5 languages by usage
+          if language_bytes:
+            top_langs = sorted(language_bytes.items(), key=lambda x: x[1], reverse=True)[:5]
+            stats["languages"] = "/".join([lang.lower() for lang, _ in top_langs])
+      except Exception as e:
+        utils.warn(f"Error fetching repos/stars/languages: {e}")
 
+    # with a token everything but the rank is a single GraphQL round trip
+    calls = {"rank": fetch_rank}
+    if github_token:
+      calls["graphql"] = fetch_graphql
+    else:
+      calls.update({"followers": fetch_followers, "prs": fetch_prs, "repos": fetch_repos})
+    utils.run_parallel(calls, timeout=deadline-time.monotonic())
+
+    # late finishers past the deadline must not change what the caller sees
+    stats = dict(stats)
     return stats if stats else None
 
-  def fetch_stackoverflow_stats(self, user_id):
+  def fetch_stackoverflow_stats(self, user_id, deadline=None):
     """Fetch StackOverflow statistics using the API and web scraping"""
     stats = {}
+    deadline = deadline or time.monotonic() + self.fetch_timeout
 
     # 1. API call for reputation and badges
-    try:
-      api_url = f"https://api.stackexchange.com/2.3/users/{user_id}?site=stackoverflow"
-      response = requests.get(api_url, timeout=10)
-      if response.status_code == 200:
-        user = response.json()["items"][0]
-        stats["reputation"] = user.get("reputation", 0)
-        stats["badges"] = {
-          "gold": user.get("badge_counts", {}).get("gold", 0),
-          "silver": user.get("badge_counts", {}).get("silver", 0),
-          "bronze": user.get("badge_counts", {}).get("bronze", 0),
-        }
-    except Exception as e:
-      utils.warn(f"Error fetching SO API: {e}")
+    def fetch_api():
+      try:
+        api_url = f"https://api.stackexchange.com/2.3/users/{user_id}?site=stackoverflow"
+        response = utils.http_get(api_url, timeout=10)
+        if response.status_code == 200:
+          user = response.json()["items"][0]
+          stats["reputation"] = user.get("reputation", 0)
+          stats["badges"] = {
+            "gold": user.get("badge_counts", {}).get("gold", 0),
+            "silver": user.get("badge_counts", {}).get("silver", 0),
+            "bronze": user.get("badge_counts", {}).get("bronze", 0),
+          }
+      except Exception as e:
+        utils.warn(f"Error fetching SO API: {e}")
 
     # 2. Scrape profile page for "People Reached"
-    try:
-      profile_url = f"https://stackoverflow.com/users/{user_id}"
-      headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-      response = requests.get(profile_url, headers=headers, timeout=10)
+    def fetch_profile():
+      try:
+        profile_url = f"https://stackoverflow.com/users/{user_id}"
+        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+        response = utils.http_get(profile_url, headers=headers, timeout=10)
 
-      if response.status_code == 200:
-        soup = BeautifulSoup(response.text, 'html.parser')
+        if response.status_code == 200:
+          from bs4 import BeautifulSoup
+          soup = BeautifulSoup(response.text, 'html.parser')
+
+          # Find impact metric: look for fs-body3 div followed by "reached" text
+          stat_divs = soup.find_all('div', class_='fs-body3')
+          for div in stat_divs:
+            # Check next sibling for "reached" text
+            siblings = list(div.next_siblings)
+            for sib in siblings[:3]:  # Check first 3 siblings
+              if hasattr(sib, 'get_text'):
+                sib_text = sib.get_text().strip().lower()
+                if 'reached' in sib_text:
+                  impact_value = div.get_text().strip()
+                  stats["impact"] = f"~{impact_value} people reached"
+                  break
+            if "impact" in stats:
+              break
+      except Exception as e:
+        utils.warn(f"Error scraping SO profile: {e}")
 
-        # Find impact metric: look for fs-body3 div followed by "reached" text
-        stat_divs = soup.find_all('div', class_='fs-body3')
-        for div in stat_divs:
-          # Check next sibling for "reached" text
-          siblings = list(div.next_siblings)
-          for sib in siblings[:3]:  # Check first 3 siblings
-            if hasattr(sib, 'get_text'):
-              sib_text = sib.get_text().strip().lower()
-              if 'reached' in sib_text:
-                impact_value = div.get_text().strip()
-                stats["impact"] = f"~{impact_value} people reached"
-                break
-          if "impact" in stats:
-            break
-    except Exception as e:
-      utils.warn(f"Error scraping SO profile: {e}")
+    utils.run_parallel({"api": fetch_api, "profile": fetch_profile}, timeout=deadline-time.monotonic())
 
+    stats = dict(stats)
     return stats if stats else None
 
   def fetch_google_scholar_stats(self, scholar_id):
@@ -717,8 +1361,9 @@ class Kalpi:
       headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
       }
-      response = requests.get(url, headers=headers, timeout=10)
+      response = utils.http_get(url, headers=headers, timeout=10)
       if response.status_code == 200:
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(response.text, 'html.parser')
         stats = {}
 
@@ -750,7 +1395,7 @@ class Kalpi:
     """Fetch latest DSCOVR EPIC natural color images"""
     try:
       url = "https://epic.gsfc.nasa.gov/api/natural"
-      response = requests.get(url, timeout=10)
+      response = utils.http_get(url, timeout=10)
       if response.status_code == 200:
         data = response.json()
         images = []
@@ -828,10 +1473,20 @@ class Kalpi:
                   pos["duration"] = self.calculate_duration(start_end[0], start_end[1])
         utils.info("Updated experience durations")
 
-      # Fetch and update GitHub stats
+      # Fetch GitHub, StackOverflow and Google Scholar stats concurrently, bounded by one deadline
+      deadline = time.monotonic() + self.fetch_timeout
+      calls = {}
+      if "contact" in cv_data and "github" in cv_data["contact"]:
+        calls["github"] = lambda: self.fetch_github_stats(cv_data["contact"]["github"]["text"], deadline=deadline)
+      if "portfolioso" in cv_data and "/" in cv_data["portfolioso"]["url"]:
+        calls["stackoverflow"] = lambda: self.fetch_stackoverflow_stats(cv_data["portfolioso"]["url"].split("/")[-2], deadline=deadline)
+      if "portfoliogs" in cv_data and "user=" in cv_data["portfoliogs"]["url"]:
+        calls["scholar"] = lambda: self.fetch_google_scholar_stats(cv_data["portfoliogs"]["url"].split("user=")[1].split("&")[0])
+      remote = utils.run_parallel(calls, timeout=self.fetch_timeout)
+
+      # Update GitHub stats
       if "contact" in cv_data and "github" in cv_data["contact"]:
-        github_username = cv_data["contact"]["github"]["text"]
-        github_stats = self.fetch_github_stats(github_username)
+        github_stats = remote.get("github")
         if github_stats and "portfoliogh" in cv_data:
           # Update metrics while preserving formatting
           for i, metric in enumerate(cv_data["portfoliogh"]["metrics"]):
@@ -871,13 +1526,13 @@ class Kalpi:
 
           utils.info(f"Updated GitHub stats ({', '.join(updated_fields)})")
 
-      # Fetch and update StackOverflow stats
+      # Update StackOverflow stats
       if "portfolioso" in cv_data:
         # Extract user ID from URL
         so_url = cv_data["portfolioso"]["url"]
         user_id = so_url.split("/")[-2] if "/" in so_url else None
         if user_id:
-          so_stats = self.fetch_stackoverflow_stats(user_id)
+          so_stats = remote.get("stackoverflow")
           if so_stats:
             for i, metric in enumerate(cv_data["portfolioso"]["metrics"]):
               if "Reputation:" in metric:
@@ -901,13 +1556,12 @@ class Kalpi:
 
             utils.info(f"Updated StackOverflow stats ({', '.join(updated_fields)})")
 
-      # Fetch and update Google Scholar stats
+      # Update Google Scholar stats
       if "portfoliogs" in cv_data:
-        # Extract scholar ID from URL
+        # the scholar id in the URL was parsed when the stats were fetched
         scholar_url = cv_data["portfoliogs"]["url"]
         if "user=" in scholar_url:
-          scholar_id = scholar_url.split("user=")[1].split("&")[0]
-          scholar_stats = self.fetch_google_scholar_stats(scholar_id)
+          scholar_stats = remote.get("scholar")
           if scholar_stats:
             for i, metric in enumerate(cv_data["portfoliogs"]["metrics"]):
               if "Citations:" in metric:
@@ -968,6 +1622,11 @@ class Kalpi:
         shutil.copy2(src, dst)
       utils.info("assets: copied %d files to %s" % (
         len(glob.glob(os.path.join(draft_assets, "*"))), post_assets))
+      # variants are ready before the next build, which then only picks them up from the manifest
+      self.load_manifest()
+      processed, unchanged = self.build_assets(["%s%s" % (asset_prefix_pub, os.path.basename(x)) for x in glob.glob(os.path.join(draft_assets, "*")) if re.search(r"\.(?:png|jpe?g)$", x, flags=re.IGNORECASE)])
+      self.save_manifest()
+      utils.info("assets: resized %d images into %s" % (processed, post_assets))
 
     # remove draft
     os.remove(draft_path)
@@ -1009,81 +1668,183 @@ class Kalpi:
     utils.info("unpublished: %s -> %s" % (post_name, draft_path))
     return True
 
-  def process_tabs(self, html):
-    """Replace tab comment markers with tab group HTML."""
-    group_re = re.compile(
-      r'<!--\s*tabs\s+(.*?)-->(.*?)<!--\s*/tabs\s*-->',
-      re.DOTALL
-    )
+  def add_stage(self, name, pattern, repl, flags=0, literal=False):
+    """Register a post-processing stage, repl is a replacement template or a function of the match, literal stages replace pattern as a plain string."""
+    self.stages.append({"name": name, "regex": None if literal else re.compile(pattern, flags), "pattern": pattern, "repl": repl})
+
+  def postprocess_html(self, html, timings=None):
+    """Apply every registered stage in order over html, per-stage time is added to timings."""
+    timings = {} if timings is None else timings
+    for stage in self.stages:
+      start = time.perf_counter()
+      if not stage["regex"]:
+        html = html.replace(stage["pattern"], stage["repl"]) if stage["pattern"] in html else html
+      else:
+        html = stage["regex"].sub(stage["repl"], html)
+      timings[stage["name"]] = timings.get(stage["name"], 0) + time.perf_counter() - start
+    return html
+
+  def tab_group(self, match):
+    """Replace a tab comment marker group with tab group HTML."""
     tab_re = re.compile(r'<!--\s*tab\s+label="([^"]+)"\s*-->')
     attr_re = re.compile(r'(\w+)="([^"]+)"')
 
-    def build_group(match):
-      attrs = dict(attr_re.findall(match.group(1)))
-      group = attrs.get("group", "tabs")
-      layout = attrs.get("layout", "tabs")
-      body = match.group(2)
-
-      parts = tab_re.split(body)
-      # parts[0] is before first tab (discard), then alternating label, content
-      labels = parts[1::2]
-      panels = parts[2::2]
-
-      is_sidebyside = layout == "side-by-side"
-      cls = "tab-group-sidebyside" if is_sidebyside else "tab-group-standard"
-
-      if is_sidebyside:
-        # Side-by-side: all panels visible, no radio inputs needed
-        items = []
-        for idx, (label, content) in enumerate(zip(labels, panels)):
-          items.append(
-            '<div class="sbs-cell"><div class="sbs-label">%s</div>%s</div>'
-            % (label, content.strip())
-          )
-        out = '<div class="tab-group-sidebyside">'
-        out += "".join(items)
-        out += '</div>'
-      else:
-        # Pure CSS tabs: radio input + label + panel as siblings
-        items = []
-        for idx, (label, content) in enumerate(zip(labels, panels)):
-          tab_id = "%s-%d" % (group, idx)
-          checked = " checked" if idx == 0 else ""
-          items.append(
-            '<input type="radio" name="%s" id="%s"%s>'
-            '<label for="%s">%s</label>'
-            '<div class="tab-panel">%s</div>'
-            % (group, tab_id, checked, tab_id, label, content.strip())
-          )
-        out = '<div class="tab-group tab-group-standard">'
-        out += "".join(items)
-        out += '</div>'
-      return out
-
-    return group_re.sub(build_group, html)
+    attrs = dict(attr_re.findall(match.group(1)))
+    group = attrs.get("group", "tabs")
+    layout = attrs.get("layout", "tabs")
+    body = match.group(2)
+
+    parts = tab_re.split(body)
+    # parts[0] is before first tab (discard), then alternating label, content
+    labels = parts[1::2]
+    panels = parts[2::2]
+
+    is_sidebyside = layout == "side-by-side"
+    cls = "tab-group-sidebyside" if is_sidebyside else "tab-group-standard"
+
+    if is_sidebyside:
+      # Side-by-side: all panels visible, no radio inputs needed
+      items = []
+      for idx, (label, content) in enumerate(zip(labels, panels)):
+        items.append(
+          '<div class="sbs-cell"><div class="sbs-label">%s</div>%s</div>'
+          % (label, content.strip())
+        )
+      out = '<div class="tab-group-sidebyside">'
+      out += "".join(items)
+      out += '</div>'
+    else:
+      # Pure CSS tabs: radio input + label + panel as siblings
+      items = []
+      for idx, (label, content) in enumerate(zip(labels, panels)):
+        tab_id = "%s-%d" % (group, idx)
+        checked = " checked" if idx == 0 else ""
+        items.append(
+          '<input type="radio" name="%s" id="%s"%s>'
+          '<label for="%s">%s</label>'
+          '<div class="tab-panel">%s</div>'
+          % (group, tab_id, checked, tab_id, label, content.strip())
+        )
+      out = '<div class="tab-group tab-group-standard">'
+      out += "".join(items)
+      out += '</div>'
+    return out
+
+  def snapshot(self):
+    """mtimes of every file under the watched source and template dirs"""
+    mtimes = {}
+    for source in [self.postsdir, self.draftsdir, self.templatesdir]:
+      for root, ds, fs in os.walk(source):
+        for name in fs:
+          path = os.path.join(root, name)
+          try:
+            mtimes[path] = os.stat(path).st_mtime_ns
+          except OSError:
+            continue
+    return mtimes
+
+  def serve(self, args, host="127.0.0.1", port=8000, interval=0.5):
+    """build into memory, serve it over http and rebuild what changed whenever sources or templates change"""
+    import http.server
+    klp = self
+    args.fast, args.drafts, args.jobs = True, True, 1
+    self.memory = {}
+    self.make(args)
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+      def __init__(self, *handlerargs, **kwargs):
+        super().__init__(*handlerargs, directory=klp.outputdir, **kwargs)
+
+      def do_GET(self):
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        filename = "%s%s" % (klp.outputdir, "%sindex.html" % (path) if path.endswith("/") else path)
+        if filename not in klp.memory:
+          # static files are served straight from the site repo
+          return super().do_GET()
+        body = klp.memory[filename].encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml" if filename.endswith(".xml") else "application/json" if filename.endswith(".json") else "text/css" if filename.endswith(".css") else "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *logargs):
+        pass
+
+    def watch():
+      mtimes = self.snapshot()
+      while True:
+        time.sleep(interval)
+        current = self.snapshot()
+        changed = [x for x in set(mtimes) | set(current) if mtimes.get(x) != current.get(x)]
+        mtimes = current
+        if not changed:
+          continue
+        start = time.perf_counter()
+        try:
+          if [x for x in changed if x.startswith(self.templatesdir)]:
+            # make reloads yaml data, jinja picks up template edits on its own, dependencies are worked out again
+            self.templatedeps = {}
+          self.make(args)
+          utils.info("rebuilt %d changed file(s) in %.0fms" % (len(changed), (time.perf_counter()-start)*1000))
+        except Exception as ex:
+          utils.error("rebuild failed: %s" % (ex))
+
+    threading.Thread(target=watch, daemon=True).start()
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    utils.info("serving %s on http://%s:%d/ (ctrl-c to stop)" % (utils.cyan(self.outputdir), host, port))
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      server.server_close()
 
   def make(self, args, postprocess=[]):
+    self.profiler = utils.Profiler(enabled=getattr(args, "profile", None) is not None, memory=not getattr(args, "no_trace_memory", False))
     if not args.fast:
       # Update CV data with latest stats before building
-      self.update_cv_data()
-
-    # Reload CV data after update (uses cached yaml if --fast)
-    with open("%s/cv/AnkurTyagi.yml" % (utils.expand_env(var="$PROJECTSDIR"))) as f:
-      self.datadict["cv"] = list(yaml.safe_load_all(f))[0]
+      with self.profiler.phase("update_cv_data"):
+        self.update_cv_data()
+
+    # Load data files after the CV update (uses cached yaml if --fast)
+    with self.profiler.phase("load_data"):
+      self.load_data()
+
+    self.rebuild = getattr(args, "rebuild", False)
+    self.jobs = getattr(args, "jobs", 1)
+    self.pagesize = max(0, getattr(args, "pagesize", 0) or 0)
+    self.seed = getattr(args, "seed", None)
+    self.inlinestyles = getattr(args, "inline_styles", False)
+    self.minifier = getattr(args, "minifier", None) or "htmlmin"
+    self.rendered, self.unchanged, self.totalsize, self.minsize, self.stagetimes = 0, 0, 0, 0, {}
+    self.written, self.skipped = 0, 0
+    self.load_manifest()
 
     # posts
     calist = [x.replace(self.basedir, "") for x in utils.search_files_all("%s/static/images/clipart" % (self.basedir))]
     self.include_drafts = getattr(args, "drafts", False)
-    posts = sorted(self.get_tree(self.postsdir, include_drafts=self.include_drafts), key=lambda post: post["epoch"], reverse=False)
-    if self.include_drafts:
-      drafts = self.get_tree(self.draftsdir, include_drafts=True)
-      posts = sorted(posts + drafts, key=lambda post: post["epoch"], reverse=False)
+    self.store = PostStore()
+    with self.profiler.phase("get_tree"):
+      posts = sorted(self.get_tree(self.postsdir, include_drafts=self.include_drafts), key=lambda post: post["epoch"], reverse=False)
+      if self.include_drafts:
+        drafts = self.get_tree(self.draftsdir, include_drafts=True)
+        posts = sorted(posts + drafts, key=lambda post: post["epoch"], reverse=False)
+      # both scans are in, edited and removed posts can go
+      self.prune_tree()
     self.datadict["posts"] = sorted(posts, key=lambda post: post["epoch"], reverse=True)
 
-    # build date for RSS
-    self.datadict["build_date"] = time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime())
+    # build date for RSS, a seeded build dates the feed by its newest post so unchanged content keeps the same feed
+    if self.seed is not None and posts:
+      self.datadict["build_date"] = max(posts, key=lambda post: post["epoch"])["rss_date"]
+    else:
+      self.datadict["build_date"] = time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime())
     total = len(posts)
+    # other posts only show up in a post through the tag index, their digests cover what they render there (seeded sparklines included)
+    members = lambda tags: {tag: [x.member() for x in self.datadict["tags"][tag]] for tag in sorted(tags) if tag in self.datadict["tags"]}
+    scope = self.tag_scope("post.html")
+    context = self.digest({"metadata": self.datadict["metadata"], "tags": members(self.datadict["tags"]) if scope is None else {}})
     for idx, post in enumerate(posts):
+      post["previous"], post["next"] = None, None
       if idx == 0:
         post["next"] = {}
         post["next"]["title"] = posts[idx+1]["title"]
@@ -1099,48 +1860,125 @@ class Kalpi:
         post["next"] = {}
         post["next"]["title"] = posts[idx+1]["title"]
         post["next"]["url"] = posts[idx+1]["url"]
-      filename = "%s%s" % (self.outputdir, post["url"])
-      output = self.get_template("post.html", datadict={"metadata": self.datadict["metadata"], "post": post, "tags": self.datadict["tags"]})
-      output = output.replace('<h1>', '<h1 class="h1 collapsible" onclick="toggle(this);">').replace('<h2>', '<h2 class="h2 collapsible" onclick="toggle(this);">').replace('<h3>', '<h3 class="h3 collapsible" onclick="toggle(this);">').replace('<h4>', '<h4 class="h4 collapsible" onclick="toggle(this);">').replace('<h5>', '<h5 class="h5 collapsible" onclick="toggle(this);">').replace('<h6>', '<h6 class="h6 collapsible" onclick="toggle(this);">').replace('<ul>', '<ul class="nested active">').replace('<ol>', '<ol class="nested active">').replace('<p>', '<p class="nested active">').replace('<pre><code>', '<pre class="nested active"><code>').replace('<pre><code class="','<pre class="nested active"><code class="').replace('<p class="nested active"><a href="/posts/', '<p><a href="/posts/').replace('<p class="nested active">published on ', '<p>published on ').replace('<p class="nested active">tagged ', '<p>tagged ')
-      output = output.replace('](https://7h3ram.github.io/posts/', '](/posts/').replace('href="https://7h3ram.github.io/posts/', 'href="/posts/')
-      #output = output.replace('BG_CLIPART_STYLE_HERE', 'class="bgclipart_sq" style="background-image: url(%s);"' % (random.choice(calist)))
-      output = self.process_tabs(output)
-      html = htmlmin.minify(output, remove_comments=True, remove_empty_space=True) if "minify" in postprocess else output
-      utils.file_save(filename, html)
-      #utils.info("rendered '%s' (%s)" % (utils.magenta(filename), utils.blue(utils.sizeof_fmt(len(html)))))
-      self.totalsize += len(output)
-      self.minsize += len(html)
-
-    # pages
-    self.render_template("cv.html", postprocess=postprocess)
-    self.render_template("fitness.html", postprocess=postprocess)
-    self.render_template("life.html", postprocess=postprocess)
-    self.render_template("read.html", postprocess=postprocess)
 
     # Enrich OSCP writeups with sparkline and tags from posts
     for writeup in self.datadict["oscp"]["resources"]["notes"]["writeups"]:
-      for post in self.datadict["posts"]:
-        if post["url"] == writeup["url"]:
-          writeup["sparkline"] = post["sparkline"]
-          writeup["tags"] = post["tags"]
-          break
-
-    self.render_template("oscp.html", postprocess=postprocess)
-    self.render_template("research.html", postprocess=postprocess)
+      post = self.store.find(writeup["url"])
+      if post:
+        writeup["sparkline"] = post["sparkline"]
+        writeup["tags"] = post["tags"]
 
     # Fetch satellite data before rendering satview
-    self.datadict["dscovr_epic_images"] = [] if args.fast else self.fetch_dscovr_epic_images(count=4)
-    self.render_template("satview.html", postprocess=postprocess)
-    self.render_template("startpage.html", postprocess=postprocess)
+    with self.profiler.phase("fetch_dscovr_epic_images"):
+      self.datadict["dscovr_epic_images"] = [] if args.fast else self.fetch_dscovr_epic_images(count=4)
 
     # default
-    self.datadict["stats"] = self.gen_stats()
-    self.datadict["tagcloud"] = self.tag_cloud()
-    self.render_template("index.html", postprocess=postprocess)
-    self.render_template("archive.html", postprocess=postprocess)
-    self.render_template("tags.html", postprocess=postprocess)
-    self.render_template("stats.html", postprocess=postprocess)
-    self.render_template("feed.xml", postprocess=[])
+    with self.profiler.phase("gen_stats"):
+      self.datadict["stats"] = self.gen_stats()
+    with self.profiler.phase("tag_cloud"):
+      self.datadict["tagcloud"] = self.tag_cloud()
+      self.save_output("%s%s" % (self.outputdir, self.stylesheet), self.presentation_css())
+    with self.profiler.phase("search"):
+      searchwritten, searchunchanged = self.build_search()
+    with self.profiler.phase("assets"):
+      # --serve leaves the site repo alone, posts keep pointing at the original images there
+      self.manifest["images"] = {post["digest"]: self.post_images(post) for post in self.datadict["posts"]}
+      imagesprocessed, imagesunchanged = (0, 0) if self.memory is not None else self.build_assets([x for post in self.datadict["posts"] for x in self.post_images(post)])
+
+    # all data is in place, queue every stale output and render them in one go
+    jobs = []
+    for idx, post in enumerate(self.datadict["posts"]):
+      filename = "%s%s" % (self.outputdir, post["url"])
+      inputs = {
+        "source": post["digest"],
+        # without --seed sparkline colors are random, a post page follows the ones listings show
+        "sparklines": [post["sparkline"], post["sparklinelong"]],
+        "template": self.template_deps("post.html")[0],
+        # with per tag lookups only the tags this post renders count
+        "context": context if scope is None else self.digest([context, members((set(post["tags"]) if None in scope else set()) | scope - {None})]),
+        "previous": post["previous"],
+        "next": post["next"],
+        "assets": [self.assets.get(x) for x in self.post_images(post)],
+        "seed": self.seed,
+        "postprocess": self.postprocess_inputs(postprocess),
+      }
+      if self.is_fresh("posts", filename, inputs):
+        self.unchanged += 1
+        continue
+      jobs.append(("posts", filename, inputs, ("post", idx, postprocess)))
+    # deleted or renamed posts leave the manifest, and the preview, the site repo keeps its published copies
+    current = set(["%s%s" % (self.outputdir, post["url"]) for post in self.datadict["posts"]])
+    for filename in [x for x in self.manifest["posts"] if x not in current]:
+      del self.manifest["posts"][filename]
+      if self.memory is not None:
+        self.memory.pop(filename, None)
+
+    # pages depend on the templates they pull in and the datadict keys those read
+    self.datadigests = {}
+    listings = self.listings()
+    for templatefile in ["cv.html", "fitness.html", "life.html", "read.html", "oscp.html", "research.html", "satview.html", "startpage.html", "index.html", "archive.html", "tags.html", "stats.html", "feed.xml"]:
+      if templatefile not in self.templatemapping:
+        utils.warn("could not find mapping for file '%s'" % (utils.red(templatefile)))
+        continue
+      if self.templatemapping[templatefile] in listings:
+        continue
+      pagepostprocess = [] if templatefile == "feed.xml" else postprocess
+      template, keys = self.template_deps(templatefile)
+      inputs = {
+        "template": template,
+        "data": self.data_digest(keys),
+        "postprocess": self.postprocess_inputs(pagepostprocess),
+      }
+      if self.is_fresh("pages", self.templatemapping[templatefile], inputs):
+        self.unchanged += 1
+        continue
+      jobs.append(("pages", self.templatemapping[templatefile], inputs, ("page", templatefile, pagepostprocess)))
+
+    # listing pages are rewritten only when their members change, pages left over from an earlier pagesize go away
+    for filename in listings:
+      templatefile, spec = listings[filename]
+      template, keys = self.template_deps(templatefile)
+      inputs = {
+        "template": template,
+        "data": self.listing_inputs(spec, keys),
+        "postprocess": self.postprocess_inputs(postprocess),
+      }
+      if self.is_fresh("pages", filename, inputs):
+        self.unchanged += 1
+        continue
+      jobs.append(("pages", filename, inputs, ("listing", templatefile, postprocess, filename, spec)))
+    for filename in [x for x in self.manifest["pages"] if x.startswith(("%s/archive/" % (self.outputdir), "%s/tags/" % (self.outputdir))) and x not in listings]:
+      del self.manifest["pages"][filename]
+      if self.memory is not None:
+        self.memory.pop(filename, None)
+      elif os.path.isfile(filename):
+        os.remove(filename)
+        try:
+          os.removedirs(os.path.dirname(filename))
+        except OSError:
+          pass
+
+    with self.profiler.phase("render"):
+      self.run_jobs(jobs)
+    with self.profiler.phase("charts"):
+      self.join_charts()
+    with self.profiler.phase("save_manifest"):
+      self.save_manifest()
+    self.mdcache.evict()
+    self.minifycache.evict()
+
+    utils.info("outputs: rendered:%d, unchanged:%d" % (self.rendered, self.unchanged))
+    utils.info("writes: written:%d, skipped:%d" % (self.written, self.skipped))
+    utils.info("markdown cache: hits:%d, misses:%d" % (self.mdcache.hits, self.mdcache.misses))
+    if self.minifycache.hits or self.minifycache.misses:
+      utils.info("minify cache (%s): hits:%d, misses:%d" % (self.minifier, self.minifycache.hits, self.minifycache.misses))
+    utils.info("search shards: written:%d, unchanged:%d" % (searchwritten, searchunchanged))
+    if imagesprocessed or imagesunchanged:
+      utils.info("images: processed:%d, unchanged:%d" % (imagesprocessed, imagesunchanged))
+    if utils.httpcache:
+      utils.info("http cache: hits:%d, revalidated:%d, misses:%d, stale:%d" % (utils.httpcache.hits, utils.httpcache.revalidated, utils.httpcache.misses, utils.httpcache.stale))
+    if self.stagetimes:
+      utils.info("postprocess: %s" % (", ".join(["%s:%.3fs" % (stage, self.stagetimes[stage]) for stage in sorted(self.stagetimes, key=lambda x: self.stagetimes[x], reverse=True)])))
 
     utils.info("size: total:%s (%d), minified:%s (%d), delta:%s (%d)" % (
       utils.sizeof_fmt(self.totalsize),
@@ -1151,12 +1989,25 @@ class Kalpi:
       self.totalsize-self.minsize
     ))
 
+    if self.profiler.enabled:
+      self.profiler.report(args.profile or "%s/profile.json" % (self.cachedir))
+
 if __name__ == "__main__":
   parser = argparse.ArgumentParser(description="%s (v%s)" % (utils.blue_bold("kalpi"), utils.green_bold("0.1")))
   parser.add_argument("--fast", action="store_true", help="skip network data collection (cv stats, satellite images)")
   parser.add_argument("--drafts", action="store_true", help="include draft posts in build for preview")
+  parser.add_argument("--rebuild", action="store_true", help="ignore the build manifest and re-render every output")
+  parser.add_argument("--jobs", metavar="N", type=int, default=1, help="render posts and pages using N worker processes")
+  parser.add_argument("--pagesize", metavar="N", type=int, default=0, help="split archive.html into pages of N posts and add per tag and per year pages (default: 0, one page per listing)")
+  parser.add_argument("--minifier", choices=["htmlmin", "fast"], default="htmlmin", help="minifier for minified outputs and template strings, fast is a regex pass with htmlmin's comment and whitespace rules (default: htmlmin)")
+  parser.add_argument("--seed", metavar="SEED", help="derive sparkline colors, tag cloud order and the feed date from SEED and the content, identical input then builds byte identical output")
+  parser.add_argument("--inline-styles", action="store_true", help="style sparklines and reading bars inline instead of with the classes in static/css/kalpi.css")
+  parser.add_argument("--profile", metavar="FILE", nargs="?", const="", help="time each build phase, trace peak memory (slows the build down) and save a json report (default: ~/.cache/kalpi/profile.json)")
+  parser.add_argument("--no-trace-memory", action="store_true", help="with --profile, record timings only and skip tracemalloc and its overhead")
   parser.add_argument("--publish", metavar="FILE", help="publish a draft (e.g. fparse.md)")
   parser.add_argument("--unpublish", metavar="FILE", help="unpublish a post back to draft")
+  parser.add_argument("--serve", action="store_true", help="serve a drafts build from memory and rebuild on changes")
+  parser.add_argument("--port", metavar="PORT", type=int, default=8000, help="port for --serve (default: 8000)")
   args = parser.parse_args()
 
   klp = Kalpi()
@@ -1164,5 +2015,7 @@ if __name__ == "__main__":
     klp.publish(args.publish)
   elif args.unpublish:
     klp.unpublish(args.unpublish)
+  elif args.serve:
+    klp.serve(args, port=args.port)
   else:
     klp.make(args)
@@ -2,27 +2,35 @@ import os
 import re
 import glob
 import json
+import stat
 import yaml
+import time
 import errno
 import codecs
 import locale
 import fnmatch
+import sqlite3
+import hashlib
+import tempfile
+import contextlib
+import tracemalloc
 import datetime
+import concurrent.futures
 import urllib.parse
-import urllib.request
 
-import requests
-import sparkline
-import prettytable
-from PIL import Image
-import matplotlib.pyplot as plt
 import logging
 import warnings
 
+# requests, matplotlib, PIL, prettytable, sparkline and bs4 are imported where they are used to keep startup fast
+
 # Suppress matplotlib font warnings
 logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
 warnings.filterwarnings('ignore', category=UserWarning, module='matplotlib')
 
+# read once at import, os.umask can only be read by setting it and serve writes from more than one thread
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+
 
 def highlight(text, color="black", bold=False):
   resetcode = "\x1b[0m"
@@ -133,8 +141,9 @@ def search_files_yml(dirpath):
 def search_files_md(dirpath):
   return search_files(dirpath, regex="*.md")
 
-def download_json(url):
-  res = requests.get(url)
+def download_json(url, ttl=300):
+  # astro.py runs hourly, a ttl well under that keeps each run from seeing the previous run's responses
+  res = http_get(url, ttl=ttl)
   if res.status_code == 200:
     return res.json()
   return None
@@ -177,6 +186,8 @@ def file_save(filename, data, mode="w"):
   if filename and filename != "":
     if "/" in filename:
       mkdirp(os.path.dirname(filename))
+    if mode == "w":
+      return file_replace(filename, data)
     try:
       with codecs.open(filename, mode, encoding="utf-8") as fo:
         fo.write(data)
@@ -187,7 +198,230 @@ def file_save(filename, data, mode="w"):
         except:
           fo.write(data.encode('utf-16', 'surrogatepass').decode('utf-16'))
 
+def file_replace(filename, data):
+  # returns False when filename already holds data, otherwise swaps in a fully written temp file
+  try:
+    content = data.encode("utf-8")
+  except UnicodeEncodeError:
+    content = data.encode("utf-16", "surrogatepass").decode("utf-16").encode("utf-8")
+  if os.path.isfile(filename) and os.path.getsize(filename) == len(content):
+    with open(filename, "rb") as fo:
+      if hashlib.sha256(fo.read()).digest() == hashlib.sha256(content).digest():
+        return False
+  # new files get the mode open() would have given them
+  filemode = stat.S_IMODE(os.stat(filename).st_mode) if os.path.isfile(filename) else 0o666 & ~UMASK
+  fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), prefix=".%s." % (os.path.basename(filename)))
+  try:
+    with os.fdopen(fd, "wb") as fo:
+      fo.write(content)
+    os.chmod(tmpname, filemode)
+    os.replace(tmpname, filename)
+  except:
+    os.remove(tmpname)
+    raise
+  return True
+
+class DiskCache:
+  """digest keyed text cache in a directory, least recently used entries are evicted beyond maxsize bytes"""
+  def __init__(self, path, maxsize=64*1024*1024):
+    self.path = path
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key):
+    filename = os.path.join(self.path, key)
+    if os.path.isfile(filename):
+      # mtime doubles as last access time for eviction
+      os.utime(filename)
+      self.hits += 1
+      return file_open(filename)
+    self.misses += 1
+    return None
+
+  def put(self, key, data):
+    file_save(os.path.join(self.path, key), data)
+    return data
+
+  def evict(self):
+    if not os.path.isdir(self.path):
+      return 0
+    entries = sorted([(x.stat().st_mtime, x.stat().st_size, x.path) for x in os.scandir(self.path) if x.is_file()])
+    size, evicted = sum([x[1] for x in entries]), 0
+    for mtime, filesize, filename in entries:
+      if size <= self.maxsize:
+        break
+      os.remove(filename)
+      size -= filesize
+      evicted += 1
+    return evicted
+
+class CachedResponse:
+  """the parts of a requests.Response callers here use, rebuilt from an http cache row"""
+  def __init__(self, url, status_code, headers, content, from_cache=True):
+    import requests
+    self.url = url
+    self.status_code = status_code
+    self.headers = requests.structures.CaseInsensitiveDict(headers)
+    self.content = content
+    self.from_cache = from_cache
+
+  @property
+  def text(self):
+    match = re.search(r"charset=([\w-]+)", self.headers.get("Content-Type", ""))
+    return self.content.decode(match.group(1) if match else "utf-8", errors="replace")
+
+  def json(self):
+    return json.loads(self.content)
+
+class HTTPCache:
+  """sqlite backed GET cache: fresh rows within ttl seconds are served locally, stale rows are revalidated with ETag/Last-Modified and served on errors"""
+  def __init__(self, path, maxage=30*86400):
+    self.path = path
+    self.hits = 0
+    self.revalidated = 0
+    self.misses = 0
+    self.stale = 0
+    mkdirp(os.path.dirname(path))
+    with self.connect() as db:
+      db.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, status INTEGER, headers TEXT, content BLOB, fetched REAL)")
+      # rows nobody asked for in maxage seconds are dropped
+      db.execute("DELETE FROM responses WHERE fetched < ?", (time.time()-maxage,))
+
+  def connect(self):
+    # one connection per call, get() runs from run_parallel threads
+    db = sqlite3.connect(self.path, timeout=30)
+    db.execute("PRAGMA journal_mode=WAL")
+    return db
+
+  def lookup(self, url):
+    with self.connect() as db:
+      row = db.execute("SELECT status, headers, content, fetched FROM responses WHERE url = ?", (url,)).fetchone()
+    return (row[0], json.loads(row[1]), row[2], row[3]) if row else None
+
+  def store(self, url, status, headers, content):
+    with self.connect() as db:
+      db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (url, status, json.dumps(headers), content, time.time()))
+
+  def touch(self, url):
+    with self.connect() as db:
+      db.execute("UPDATE responses SET fetched = ? WHERE url = ?", (time.time(), url))
+
+  def get(self, url, headers={}, timeout=None, ttl=3600):
+    import requests
+    row = self.lookup(url)
+    if row and time.time() - row[3] < ttl:
+      self.hits += 1
+      return CachedResponse(url, row[0], row[1], row[2])
+    reqheaders = dict(headers)
+    if row:
+      cachedheaders = requests.structures.CaseInsensitiveDict(row[1])
+      if cachedheaders.get("ETag"):
+        reqheaders["If-None-Match"] = cachedheaders["ETag"]
+      if cachedheaders.get("Last-Modified"):
+        reqheaders["If-Modified-Since"] = cachedheaders["Last-Modified"]
+    try:
+      res = requests.get(url, headers=reqheaders, timeout=timeout)
+    except Exception:
+      if not row:
+        raise
+      self.stale += 1
+      return CachedResponse(url, row[0], row[1], row[2])
+    if row and res.status_code == 304:
+      self.revalidated += 1
+      self.touch(url)
+      return CachedResponse(url, row[0], row[1], row[2])
+    if res.status_code == 200:
+      self.misses += 1
+      self.store(url, res.status_code, dict(res.headers), res.content)
+      return CachedResponse(url, res.status_code, dict(res.headers), res.content, from_cache=False)
+    if row and res.status_code >= 500:
+      self.stale += 1
+      return CachedResponse(url, row[0], row[1], row[2])
+    return res
+
+httpcache = None
+
+def http_get(url, headers={}, timeout=None, ttl=3600):
+  # requests.get through the shared cache at $HOME/.cache/kalpi/http.db
+  global httpcache
+  if httpcache is None:
+    httpcache = HTTPCache(os.path.join(expand_env(var="$HOME"), ".cache", "kalpi", "http.db"))
+  return httpcache.get(url, headers=headers, timeout=timeout, ttl=ttl)
+
+class Profiler:
+  """wall time and peak traced memory per named phase plus per item timings, a no-op unless enabled"""
+  def __init__(self, enabled=False, memory=True):
+    self.enabled = enabled
+    self.memory = memory
+    self.phases = {}
+    self.items = {}
+    self.stack = []
+
+  @contextlib.contextmanager
+  def phase(self, name):
+    if not self.enabled:
+      yield
+      return
+    if self.memory and not tracemalloc.is_tracing():
+      tracemalloc.start()
+    if self.memory and self.stack:
+      # the enclosing phase keeps the peak seen so far, nested phases reset it
+      self.stack[-1][1] = max(self.stack[-1][1], tracemalloc.get_traced_memory()[1])
+    if self.memory:
+      tracemalloc.reset_peak()
+    self.stack.append([name, 0])
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      elapsed = time.perf_counter() - start
+      name, peak = self.stack.pop()
+      peak = max(peak, tracemalloc.get_traced_memory()[1]) if self.memory else 0
+      if self.stack:
+        self.stack[-1][1] = max(self.stack[-1][1], peak)
+      entry = self.phases.setdefault(name, {"calls": 0, "seconds": 0, "peak_bytes": 0})
+      entry["calls"] += 1
+      entry["seconds"] += elapsed
+      entry["peak_bytes"] = max(entry["peak_bytes"], peak)
+
+  def record(self, group, name, timings):
+    if self.enabled:
+      self.items.setdefault(group, {})[name] = timings
+
+  def report(self, filename, top=10):
+    """save phases and item timings as json, print phases and the top slowest items per group"""
+    save_json({"phases": self.phases, "items": self.items}, filename)
+    rows = ["%s___%d___%.3f___%s" % (name, self.phases[name]["calls"], self.phases[name]["seconds"], sizeof_fmt(self.phases[name]["peak_bytes"]) if self.memory else "-") for name in self.phases]
+    to_table(["Phase", "Calls", "Seconds", "Peak"], rows, aligndict={"Phase": "l", "Calls": "r", "Seconds": "r", "Peak": "r"})
+    for group in sorted(self.items):
+      slowest = sorted(self.items[group].items(), key=lambda x: x[1].get("total", 0), reverse=True)[:top]
+      rows = ["%s___%.3f___%s" % (trim(name.split("/")[-1]), timings.get("total", 0), ", ".join(["%s:%.3f" % (key, timings[key]) for key in sorted(timings, key=lambda x: timings[x], reverse=True) if key != "total"][:3])) for name, timings in slowest]
+      to_table(["Slowest %s" % (group), "Seconds", "Breakdown"], rows, aligndict={"Slowest %s" % (group): "l", "Seconds": "r", "Breakdown": "l"})
+    info("profile saved to %s" % (filename))
+
+def run_parallel(calls, workers=8, timeout=None, quiet=False):
+  # runs {key: callable} on a thread pool, returns {key: result} for calls that returned before timeout
+  results = {}
+  if not calls:
+    return results
+  pool = concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(calls)))
+  futures = {pool.submit(calls[key]): key for key in calls}
+  done, pending = concurrent.futures.wait(futures, timeout=max(0, timeout) if timeout is not None else None)
+  for future in done:
+    try:
+      results[futures[future]] = future.result()
+    except Exception as ex:
+      if not quiet:
+        warn("%s failed: %s" % (futures[future], ex))
+  if pending and not quiet:
+    warn("gave up waiting on %s" % (", ".join([str(futures[x]) for x in pending])))
+  pool.shutdown(wait=False, cancel_futures=True)
+  return results
+
 def download(url, filename, timeout=5):
+  # "latest" images change under fixed urls and are large, they skip the http cache
+  import requests
   res = requests.get(url, timeout=timeout)
   print(url, res.status_code)
   if res.status_code == 200:
@@ -196,13 +430,13 @@ def download(url, filename, timeout=5):
   else:
     return False
 
-def get_http_res(url, headers={}):
-  res = requests.get(cleanup_url(url), headers=headers)
+def get_http_res(url, headers={}, ttl=3600):
+  res = http_get(cleanup_url(url), headers=headers, ttl=ttl)
   print(url, res.status_code)
   return res
 
-def get_http(url, headers={}):
-  res = requests.get(cleanup_url(url), headers=headers)
+def get_http(url, headers={}, ttl=3600):
+  res = http_get(cleanup_url(url), headers=headers, ttl=ttl)
   print(url, res.status_code)
   if res.status_code == 200:
     return res.json()
@@ -210,6 +444,7 @@ def get_http(url, headers={}):
     return {}
 
 def post_http(url, data={}, headers={}):
+  import requests
   res = requests.post(cleanup_url(url), data=json.dumps(data), headers=headers)
   print(url, res.status_code)
   if res.status_code == 200:
@@ -218,8 +453,59 @@ def post_http(url, data={}, headers={}):
     return {}
 
 def strip_html(data):
+  from bs4 import BeautifulSoup
   return re.sub(r"\s+", " ", BeautifulSoup(data, "lxml").text)
 
+# comments, verbatim blocks, the head and the doctype are handled one by one, text between them in a few regex passes
+# every pattern starts with a literal or a character class so the scan for candidates stays in the regex engine
+minify_blocks = re.compile(r"<(?:(?P<comment>!--(?P<body>.*?)-->)|(?P<pre>(?P<pretag>pre|textarea|script|style)\b[^>]*>.*?</(?P=pretag)\s*>)|(?P<head>(?P<headopen>head\b[^>]*>)(?P<headbody>.*?)(?P<headclose></head\s*>))|(?P<doctype>![dD][oO][cC][tT][yY][pP][eE][^>]*>))", re.DOTALL | re.IGNORECASE)
+# whitespace only text between tags, any or just the runs holding a line break
+minify_empty = re.compile(r"[\x20\x09\x0a\x0c\x0d](?<=>[\x20\x09\x0a\x0c\x0d])[\x20\x09\x0a\x0c\x0d]*(?=<)")
+minify_empty_lines = re.compile(r"[\x20\x09\x0a\x0c\x0d](?<=>[\x20\x09\x0a\x0c\x0d])(?:(?<=[\x0a\x0d])[\x20\x09\x0a\x0c\x0d]*|[\x20\x09\x0c]*[\x0a\x0d][\x20\x09\x0a\x0c\x0d]*)(?=<)")
+# runs that collapse to one space, only in text as the lookahead fails inside a tag
+minify_spaces = re.compile(r"[\x20\x09\x0a\x0c\x0d](?:(?<=[\x09\x0a\x0c\x0d])[\x20\x09\x0a\x0c\x0d]*|[\x20\x09\x0a\x0c\x0d]+)(?=[^<>]*<)")
+minify_title = re.compile(r"(<title\b[^>]*>) ?(.*?) ?(</title\s*>)", re.DOTALL | re.IGNORECASE)
+
+def minify_text(text, remove_empty_space=True, inhead=False):
+  # text sits between blocks that end with > and start with <, padding lets the lookarounds see that
+  text = ">%s<" % (text)
+  if inhead:
+    text = minify_empty.sub("", text)
+  elif remove_empty_space:
+    text = minify_empty_lines.sub("", text)
+  text = minify_spaces.sub(" ", text)[1:-1]
+  return minify_title.sub(r"\1\2\3", text) if inhead else text
+
+def minify_html(html, remove_comments=True, remove_empty_space=True, inhead=False):
+  """htmlmin's comment and whitespace rules (remove_comments, remove_empty_space) applied with regexes, tags and
+  attributes are copied as is, pre, textarea, script and style blocks are left untouched"""
+  out = []
+  pos, afterdoctype = 0, False
+  for match in minify_blocks.finditer(html):
+    out.append(minify_text(html[pos:match.start()], remove_empty_space=remove_empty_space, inhead=inhead or afterdoctype))
+    kind = match.lastgroup
+    if kind == "comment":
+      # <!--! ... --> and conditional comments survive remove_comments
+      body = match.group("body")
+      if not remove_comments or re.match(r"^(?:!|\[if\s)", body):
+        out.append("<!--%s-->" % (body[1:] if body.startswith("!") else body))
+    elif kind == "head":
+      out.append("<%s%s%s" % (match.group("headopen"), minify_html(match.group("headbody"), remove_comments=remove_comments, remove_empty_space=remove_empty_space, inhead=True), match.group("headclose")))
+    elif kind == "doctype":
+      out = [x for x in out if x.strip("\x20\x09\x0a\x0c\x0d")]
+      out.append(match.group(0))
+    else:
+      out.append(match.group(0))
+    afterdoctype = kind == "doctype"
+    pos = match.end()
+  out.append(minify_text(html[pos:], remove_empty_space=remove_empty_space, inhead=inhead or afterdoctype))
+
+  # a dropped comment between two spaces would otherwise leave both behind
+  for idx in range(1, len(out)):
+    if out[idx].startswith(" ") and out[idx-1].endswith(" "):
+      out[idx] = out[idx][1:]
+  return "".join(out)
+
 def datetimefilter(datestr, format='%Y/%m/%d %H:%M:%S'):
   try:
     return datetime.datetime.strptime(str(datestr), '%Y%m%dT%H:%M:%SZ').strftime(format)
@@ -343,6 +629,7 @@ def yturl2verboseid(url):
   return url
 
 def sparkify(difficulty):
+  import sparkline
   return sparkline.sparkify(difficulty)
 
 def chunkify(l, n):
@@ -422,6 +709,7 @@ def to_markdown_table(pt):
   return "\n".join(markdown)
 
 def get_table(header, rows, delim="___", aligndict=None, markdown=False, colalign=None):
+  import prettytable
   table = prettytable.PrettyTable()
   table.field_names = header
   table.align = "c"; table.valign = "m"
@@ -586,6 +874,7 @@ def show_machines(data, sort_key="name", jsonify=False):
     to_table(header=header, rows=rows, delim="___", aligndict=None, markdown=False)
 
 def to_xkcd(plotdict, filename, title, rotate=True, trimlength=20):
+  import matplotlib.pyplot as plt
   datadict = {}
   for key in plotdict:
     datadict[key] = [[key], [plotdict[key]]]
@@ -613,6 +902,7 @@ def to_xkcd(plotdict, filename, title, rotate=True, trimlength=20):
     plt.close()
 
 def to_sparklines(items, filename, transparent=True):
+  import matplotlib.pyplot as plt
   colormap = ["#9acc14", "#9acc14", "#9acc14", "#f7af3e", "#f7af3e", "#f7af3e", "#f7af3e", "#db524b", "#db524b", "#db524b"]
   barlist = plt.bar([str(x) for x in range(len(items))], items, width=0.95)
   for i in range(len(items)):
@@ -627,6 +917,30 @@ def to_sparklines(items, filename, transparent=True):
   plt.savefig(filename, dpi=300, transparent=transparent)
   plt.close()
 
+def to_image_variants(filename, prefix, widths, quality=80):
+  """write <prefix>.<width>w.webp per width (capped at the image width) and, for opaque images, a <prefix>.jpg fallback at the largest"""
+  # prefix carries the source digest, variants already on disk can only be stale if the settings changed
+  from PIL import Image, ImageOps
+  with Image.open(filename) as image:
+    alpha = image.mode in ["RGBA", "LA"] or (image.mode == "P" and "transparency" in image.info)
+    # exif orientations 5 to 8 rotate by 90 degrees, the displayed width is the stored height
+    width = image.height if image.getexif().get(0x0112, 1) in [5, 6, 7, 8] else image.width
+    targets = sorted(set([min(x, width) for x in widths]))
+    variants = [[target, "%s.%dw.webp" % (prefix, target)] for target in targets]
+    fallback = None if alpha else "%s.jpg" % (prefix)
+    if all([os.path.isfile(x[1]) for x in variants]) and (not fallback or os.path.isfile(fallback)):
+      return variants, fallback
+    image = ImageOps.exif_transpose(image).convert("RGBA" if alpha else "RGB")
+    for target, output in variants:
+      resized = image if target == image.width else image.resize((target, max(1, round(image.height*target/image.width))), Image.LANCZOS)
+      resized.save("%s.tmp" % (output), "WEBP", quality=quality, method=4)
+      os.replace("%s.tmp" % (output), output)
+    if fallback:
+      resized = image if targets[-1] == image.width else image.resize((targets[-1], max(1, round(image.height*targets[-1]/image.width))), Image.LANCZOS)
+      resized.save("%s.tmp" % (fallback), "JPEG", quality=quality+5, optimize=True, progressive=True)
+      os.replace("%s.tmp" % (fallback), fallback)
+  return variants, fallback
+
 def hex2rgb(hexstr="#ffcb6b"):
   if hexstr and hexstr != "":
     return tuple(int(hexstr.replace("#", "")[i:i+2], 16) for i in (0, 2, 4))